@@ -31,15 +31,24 @@
 from heapq import *
 import array
 import argparse
+import concurrent.futures
 import os
+import struct
 import sys
-from collections import defaultdict
+from collections import Counter, defaultdict
+
+# NumPy is optional, it makes counting symbols and packing the encoded bits faster
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # Notes about this implementation:
 #  1) It does not support EOF huffman codes. This makes it simpler for use with 8-bit/byte based alphabets.
 #     Instead we transmit the unpacked size as an indicator for how many symbols exist in the file. We also transmit the number of padding bits.
-#  2) We only support huffman code sizes upto and including 16 bits in length.
-#  3) Intended for use on small files (ie. < 10Mb), since much of the code uses in-memory manipulation. 
+#  2) Code lengths are limited to maxCodeLength bits (default MAX_CODE_BIT_LENGTH), see limitCodeLengths().
+#  3) Intended for use on small files (ie. < 10Mb), since much of the code uses in-memory manipulation.
+#     Larger files can be split into chunks with their own tables by encodeChunked(), which can use several processes.
 #  4) It is binary byte based rather than text based
 #  5) It generates a canonical code table, and emits a header as follows:
 #       [4 bytes][Uncompressed data size]
@@ -48,62 +57,128 @@ from collections import defaultdict
 #       [Nb bytes][bit length table]
 #       [Ns bytes][symbol table]
 #       [Data...]
+#     With streams = 4 (see encode()) the top bit of the size is set, the data is split into 4 parts which are coded as
+#     separate bitstreams with the same table (like Huff0), so a decoder can decode them independently:
+#       [12 bytes][Jump table: 4 byte sizes of the first 3 bitstreams]
+#       [Data...] the 4 bitstreams, the first 3 parts have (size + 3) / 4 symbols, the last one has the rest
 #  6) See decode() for example parsing
-#
-# TODO: add a peek table
-
-if sys.version_info[0] > 2:
-    print("Python 2 only")
-    sys.exit()
+#  7) The decoder resolves codes with a peek table of PEEK_BITS bits, longer codes use a secondary table (see buildDecodeTable())
 
 
 class Huffman:
 
     MAX_CODE_BIT_LENGTH = 20    # change this if you need to check the codes are within a specific bit length range
     MAX_SYMBOLS = 256           # just for clarity of code. 
+    FLUSH_BITS = 256            # the encoder writes out whole bytes when the bit accumulator holds this many bits
+    NUMPY_CHUNK = 65536         # symbols packed per step by the NumPy encoder (which needs NUMPY_CHUNK * max code length bytes)
+    PEEK_BITS = 11              # bits looked up at once by the decoder, codes up to this length are decoded with a single lookup
+    CHUNK_SIZE = 65536          # default chunk size of encodeChunked()
+    MAX_CHUNK_SIZE = (1 << 29) - 1  # the header of a chunk stores its size in 29 bits
+    CHUNK_NEW_TABLE = 0         # chunk types of encodeChunked()
+    CHUNK_PREVIOUS_TABLE = 1
+    CHUNK_STORED = 2
+    CHUNK_INTERLEAVED = 0x80    # chunk type flag: the chunk has 4 bitstreams
+    INTERLEAVED_FLAG = 0x80     # header flag (in the top byte of the size): the data has 4 bitstreams
+    INTERLEAVED_STREAMS = 4
     VERBOSE = False
 
-    def __init__(self):
+    # maxCodeLength limits the length of the codes (up to MAX_CODE_BIT_LENGTH), for example to 11 or 12 bits
+    # so the decoder's peek table resolves every code with one lookup
+    def __init__(self, maxCodeLength = MAX_CODE_BIT_LENGTH):
+        assert 1 <= maxCodeLength <= self.MAX_CODE_BIT_LENGTH
+        self.maxCodeLength = maxCodeLength
         self.key = {}
         self.rKey = {}
         self.table_bitlengths = []
         self.table_symbols = []
+        # integer code and bit length of each symbol, used by encode()
+        self.codes = [0] * self.MAX_SYMBOLS
+        self.lengths = [0] * self.MAX_SYMBOLS
 
     def build(self, phrase):
         self.setFrequency(phrase)
         self.buildTree()
         self.buildKey()
+        self.limitCodeLengths()
         self.buildCanonical()   # convert tree to canonical codes.        
 
+    # count the symbols at C speed, only symbols which occur in the phrase are kept
     def setFrequency(self, phrase):
-        self.frequency = defaultdict(int)
-        for c in phrase:
-            self.frequency[c] += 1
-        
+        phrase = self.toBytes(phrase)
+        if numpy is not None:
+            counts = numpy.bincount(numpy.frombuffer(phrase, dtype=numpy.uint8), minlength=self.MAX_SYMBOLS)
+            self.frequency = { int(n) : int(counts[n]) for n in numpy.flatnonzero(counts) }
+        else:
+            self.frequency = dict(Counter(phrase))
+
+    # phrases are byte strings, lists of symbols are converted
+    def toBytes(self, phrase):
+        if isinstance(phrase, (bytes, bytearray)):
+            return phrase
+        if isinstance(phrase, memoryview):
+            return phrase.cast('B')
+        return bytes(phrase)
+
 
+    # nodes are [weight, order, symbol] or [weight, order, left, right], order breaks ties between equal weights
+    # (Python 3 can't compare a symbol with a node)
     def buildTree(self):
-        self.heap = [[v, k] for k, v in self.frequency.iteritems()]
+        self.heap = [[v, k, k] for k, v in sorted(self.frequency.items())]
         heapify(self.heap)
+        order = self.MAX_SYMBOLS
         while len(self.heap) > 1:
             left, right = heappop(self.heap), heappop(self.heap)
-            heappush(self.heap, [left[0] + right[0], left, right])
+            heappush(self.heap, [left[0] + right[0], order, left, right])
+            order += 1
 
     def buildKey(self, root=None, code=''):
         if root is None:
-            self.buildKey(self.heap[0])
-            for k,v in self.key.iteritems():
+            # a single symbol still needs a 1 bit code
+            self.buildKey(self.heap[0], '0' if len(self.heap[0]) == 3 else '')
+            for k,v in self.key.items():
                 self.rKey[v] = k
-        elif len(root) == 2:
-            self.key[root[1]] = code
+        elif len(root) == 3:
+            self.key[root[2]] = code
         else:
-            self.buildKey(root[1], code+'0')
-            self.buildKey(root[2], code+'1')
+            self.buildKey(root[2], code+'0')
+            self.buildKey(root[3], code+'1')
+
+    # if the tree has codes longer than maxCodeLength, replace the code lengths with optimal limited ones (package-merge)
+    # only the lengths of the codes in self.key matter from here on, buildCanonical() assigns the codes
+    def limitCodeLengths(self):
+        if max(len(code) for code in self.key.values()) <= self.maxCodeLength:
+            return
+        if len(self.key) > (1 << self.maxCodeLength):
+            raise ValueError(str(len(self.key)) + " symbols don't fit into codes of " + str(self.maxCodeLength) + " bits")
+
+        # leaves sorted by weight, each item is (weight, symbols in the item)
+        leaves = [(weight, (symbol,)) for symbol, weight in sorted(self.frequency.items(), key=lambda x: (x[1], x[0]))]
+
+        # each round pairs up the items of the previous round into packages and merges them with the leaves again
+        items = leaves
+        for n in range(self.maxCodeLength - 1):
+            packages = [(items[i][0] + items[i+1][0], items[i][1] + items[i+1][1]) for i in range(0, len(items) - 1, 2)]
+            items = sorted(leaves + packages, key=lambda x: x[0])
+
+        # the code length of a symbol is the number of times it occurs in the 2n-2 lightest items
+        lengths = defaultdict(int)
+        for weight, symbols in items[:2 * len(leaves) - 2]:
+            for symbol in symbols:
+                lengths[symbol] += 1
+
+        for symbol in self.key:
+            self.key[symbol] = '0' * lengths[symbol]
+
+        if self.VERBOSE:
+            print("code lengths limited to " + str(self.maxCodeLength) + " bits")
 
     # replace the previously calculated huffman tree codes with canonical codes
     def buildCanonical(self):
 
         # convert the tree to an array of (bitlength, symbol) tuples
         ktable = []
+        self.codes = [0] * self.MAX_SYMBOLS
+        self.lengths = [0] * self.MAX_SYMBOLS
         for n in range(self.MAX_SYMBOLS):
             if n in self.key:
                 ktable.append( (len(self.key[n]), n ) )
@@ -116,7 +191,7 @@ class Huffman:
         maxbits = ktable[-1][0]
         # make sure our codes comply with the length constraints
         assert minbits > 0
-        assert maxbits <= self.MAX_CODE_BIT_LENGTH
+        assert maxbits <= self.maxCodeLength
 
         # now we build the canonical codes, replacing the previously calculated codes as we go.
         bitlength = ktable[0][0] # start with smallest code length, always the first entry since sort
@@ -127,6 +202,8 @@ class Huffman:
             bitlength = k[0]
             codestring = format(code, '0' + str(bitlength) + 'b') # convert the code to a binary format string, leading zeros set to bitlength                
             self.key[k[1]] = codestring
+            self.codes[k[1]] = code
+            self.lengths[k[1]] = bitlength
             code = (code + 1) 
             if n < (numsymbols - 1):
                 code <<= ( ktable[n+1][0] - bitlength )
@@ -150,7 +227,7 @@ class Huffman:
 
 
 
-    def addHeader(self, src_data, cmp_data, wastedBits = 0):
+    def addHeader(self, src_data, cmp_data, wastedBits = 0, streams = 1):
 
         block = bytearray()
 
@@ -162,7 +239,7 @@ class Huffman:
         block.append( data_size & 255 )
         block.append( (data_size >> 8) & 255 )
         block.append( (data_size >> 16) & 255 )
-        block.append( ((data_size >> 24) & 31) )
+        block.append( ((data_size >> 24) & 31) | (self.INTERLEAVED_FLAG if streams == self.INTERLEAVED_STREAMS else 0) )
 
         # 1 byte symbol count
         # Note: this could be alternatively calculated as the sum of the non-zero bitlengths.  
@@ -196,48 +273,34 @@ class Huffman:
         return block
 
     # Huffman compress the given bytearray 'phrase' using the tree calculated by build()
+    # streams = 4 splits the data into 4 bitstreams with a jump table (see the notes at the top)
     # Returns a bytearray() of the encoded data, with optional header data
-    def encode(self, phrase, header = True):
+    def encode(self, phrase, header = True, streams = 1):
 
-        output = bytearray()
-
-        # huffman encode and transmit the data stream
-        currentbyte = 0  # The accumulated bits for the current byte, always in the range [0x00, 0xFF]
-        numbitsfilled = 0  # Number of accumulated bits in the current byte, always between 0 and 7 (inclusive)
+        assert streams in (1, self.INTERLEAVED_STREAMS)
+        phrase = self.toBytes(phrase)
 
-        sz = 0
-        # for each symbol in the input data, fetch the assigned code and emit it to the output bitstream
-        fastcount = 0
-        bitsize_to_count = 8
-        for c in phrase:
-            k = self.key[c]
-            sz += len(k)
-            if len(k) <= bitsize_to_count:
-                fastcount += 1
-            for b in k:
-                bit = int(b)
-                assert bit == 0 or bit == 1
-                currentbyte = (currentbyte << 1) | bit
-                numbitsfilled += 1
-                if numbitsfilled == 8:  # full byte, flush to output
-                    output.append(currentbyte)
-                    currentbyte = 0
-                    numbitsfilled = 0                  
-
-        if self.VERBOSE:
+        if self.VERBOSE and len(phrase) > 0:
+            bitsize_to_count = 8
+            fastcount = sum(count for symbol, count in Counter(phrase).items() if self.lengths[symbol] <= bitsize_to_count)
             print(" " + str(fastcount) + " of " + str(len(phrase)) + " symbols were " + str(bitsize_to_count) + " bits or less in size (" + str(fastcount*100/len(phrase)) + "%)")
 
-        # align to byte. we could emit code >7 bits in length to prevent decoder finding a spurious code at the end, but its likely
-        # some data sets may contain codes <7 bits. Easier to just pad wasted bytes.
-        wastedbits = (8 - numbitsfilled) & 7
-        while (numbitsfilled < 8) and wastedbits:
-            currentbyte = (currentbyte << 1) | 1
-            numbitsfilled += 1
-        output.append(currentbyte)
+        if streams == 1:
+            output = self.encodeStream(phrase)
+        else:
+            # jump table followed by the bitstreams
+            parts = []
+            start = 0
+            for count in self.streamCounts(len(phrase)):
+                parts.append(self.encodeStream(phrase[start:start + count]))
+                start += count
+            output = bytearray(struct.pack('<III', *[len(part) for part in parts[:-1]]))
+            for part in parts:
+                output += part
 
         # add headers if required.
         if header:
-            output = self.addHeader(phrase, output, wastedBits = wastedbits)
+            output = self.addHeader(phrase, output, streams = streams)
 
         if header:
             # test decode
@@ -245,16 +308,130 @@ class Huffman:
 
         return output
 
-    # test decoder
-    def decode(self, data, source):
+    # number of symbols in each bitstream of the interleaved format
+    def streamCounts(self, size):
+        part = (size + self.INTERLEAVED_STREAMS - 1) // self.INTERLEAVED_STREAMS
+        return [ min(part, max(0, size - n * part)) for n in range(self.INTERLEAVED_STREAMS) ]
 
-        # read the header
-        if self.VERBOSE:
-            print("Checking data...")
+    # encode one bitstream, padded to whole bytes
+    def encodeStream(self, phrase):
+
+        # huffman encode the data stream, leaving the last 0-7 bits in currentbyte
+        if numpy is not None:
+            output, currentbyte, numbitsfilled = self.packBitsNumpy(phrase)
+        else:
+            output, currentbyte, numbitsfilled = self.packBits(phrase)
+
+        # align to byte. we could emit code >7 bits in length to prevent decoder finding a spurious code at the end, but its likely
+        # some data sets may contain codes <7 bits. Easier to just pad wasted bytes.
+        wastedbits = (8 - numbitsfilled) & 7
+        currentbyte = (currentbyte << wastedbits) | ((1 << wastedbits) - 1)
+        output.append(currentbyte)
+        return output
+
+    # emit the code of each symbol to a bitstream, using the integer code tables built by buildCanonical()
+    # codes are shifted into a wide integer accumulator, which is written out in whole bytes every FLUSH_BITS bits
+    # returns (output bytearray, remaining bits, number of remaining bits)
+    def packBits(self, phrase):
+
+        codes = self.codes
+        lengths = self.lengths
+        flushbits = self.FLUSH_BITS
+
+        output = bytearray()
+        accumulator = 0
+        numbits = 0
+        for c in phrase:
+            accumulator = (accumulator << lengths[c]) | codes[c]
+            numbits += lengths[c]
+            if numbits >= flushbits:
+                spare = numbits & 7
+                output += (accumulator >> spare).to_bytes(numbits >> 3, 'big')
+                accumulator &= (1 << spare) - 1
+                numbits = spare
+
+        spare = numbits & 7
+        output += (accumulator >> spare).to_bytes(numbits >> 3, 'big')
+        return output, accumulator & ((1 << spare) - 1), spare
+
+    # same as packBits() using NumPy, each chunk of symbols is expanded to a matrix of code bits and packed with packbits()
+    def packBitsNumpy(self, phrase):
+
+        # row n of bitrows holds the code bits of symbol n (most significant bit first), valid marks the used columns
+        lengths = numpy.array(self.lengths, dtype=numpy.int32)
+        positions = numpy.arange(max(self.lengths), dtype=numpy.int32)
+        shifts = lengths[:, None] - 1 - positions[None, :]
+        bitrows = ((numpy.array(self.codes, dtype=numpy.uint32)[:, None] >> numpy.maximum(shifts, 0)) & 1).astype(numpy.uint8)
+        valid = shifts >= 0
+
+        output = bytearray()
+        leftover = numpy.zeros(0, dtype=numpy.uint8)
+        symbols = numpy.frombuffer(phrase, dtype=numpy.uint8)
+        for start in range(0, len(symbols), self.NUMPY_CHUNK):
+            chunk = symbols[start:start + self.NUMPY_CHUNK]
+            stream = numpy.concatenate((leftover, bitrows[chunk][valid[chunk]]))
+            whole = len(stream) & ~7
+            output += numpy.packbits(stream[:whole]).tobytes()
+            leftover = stream[whole:]
+
+        currentbyte = 0
+        for bit in leftover:
+            currentbyte = (currentbyte << 1) | int(bit)
+        return output, currentbyte, len(leftover)
+
+    # build the decoder lookup tables from the header tables (length_table[n] = number of codes with bitlength n, n > 0)
+    # entries are (symbol << 5) | bitlength
+    # - the peek table is indexed by the next peekbits of the stream
+    # - codes longer than peekbits have an entry with bitlength 0 which holds the offset of a secondary table,
+    #   indexed by the following (maxbits - peekbits) bits
+    # - entries of 0 are invalid codes
+    # returns (peek table, secondary table, peekbits, maxbits)
+    def buildDecodeTable(self, length_table, symbol_table):
+
+        maxbits = len(length_table) - 1
+        if maxbits < 1 or sum(length_table[1:]) != len(symbol_table):
+            raise ValueError("Huffman header is invalid")
+        peekbits = min(self.PEEK_BITS, maxbits)
+        subbits = maxbits - peekbits
+
+        peek = [0] * (1 << peekbits)
+        secondary = [0] # offset 0 is never used, so a subtable offset is always non-zero
+
+        # assign the canonical codes in the same order as buildCanonical()
+        code = 0
+        index = 0
+        for bitlength in range(1, maxbits + 1):
+            for n in range(length_table[bitlength]):
+                entry = (symbol_table[index] << 5) | bitlength
+                index += 1
+                if bitlength <= peekbits:
+                    # all peek values starting with this code
+                    fill = peekbits - bitlength
+                    peek[code << fill : (code + 1) << fill] = [entry] * (1 << fill)
+                else:
+                    prefix = code >> (bitlength - peekbits)
+                    if peek[prefix] == 0:
+                        peek[prefix] = len(secondary) << 5
+                        secondary += [0] * (1 << subbits)
+                    offset = peek[prefix] >> 5
+                    fill = maxbits - bitlength
+                    low = code & ((1 << (bitlength - peekbits)) - 1)
+                    secondary[offset + (low << fill) : offset + ((low + 1) << fill)] = [entry] * (1 << fill)
+                code += 1
+            code <<= 1
+
+        return peek, secondary, peekbits, maxbits
+
+    # read the header emitted by addHeader()
+    # returns (uncompressed size, decoder tables from buildDecodeTable(), header size, number of bitstreams)
+    def readHeader(self, data):
+
+        if len(data) < 6:
+            raise ValueError("Huffman header is truncated")
 
         # get the unpacked size - this tells us how many symbols to decode
         unpacked_size = data[0] + (data[1]<<8) + (data[2]<<16) + ((data[3] & 31)<<24) # uncompressed size
-        wastedbits = data[3] >> 5
+        streams = self.INTERLEAVED_STREAMS if data[3] & self.INTERLEAVED_FLAG else 1
         
         symbol_table_size = data[4]      # fetch the number of symbols in the symbol table
         length_table_size = data[5] + 1  # fetch the number of entries in the bit length table (+1 because we include zero)
@@ -265,73 +442,227 @@ class Huffman:
 
         length_table = data[5:5+length_table_size]
         symbol_table = data[5+length_table_size:5+length_table_size+symbol_table_size]
+        if len(symbol_table) != symbol_table_size:
+            raise ValueError("Huffman header is truncated")
+
+        tables = self.buildDecodeTable(length_table, symbol_table)
+        return unpacked_size, tables, 5 + length_table_size + symbol_table_size, streams
+
+    # decode data with a header (as emitted by encode()), returns a bytearray of the decoded data
+    # if source is given, the decoded data is checked against it (test decode)
+    def decode(self, data, source = None):
+
+        # read the header
+        if self.VERBOSE:
+            print("Checking data...")
+
+        unpacked_size, tables, header_size, streams = self.readHeader(data)
+        output = self.decodeStreams(memoryview(data)[header_size:], unpacked_size, tables, streams)
 
-        # decode the stream
-        currentbyte = 5 + length_table_size + symbol_table_size
+        if source is not None:
+            assert len(output) == len(source)
+            assert output == source
+
+            if self.VERBOSE:
+                print(" Test decode OK.")
+
+        return output
+
+    # decode the data of encode() without header, either a single bitstream or a jump table and 4 bitstreams
+    # the bitstreams are independent, so they could be decoded in any order or at the same time
+    def decodeStreams(self, data, unpacked_size, tables, streams):
+
+        if streams == 1:
+            return self.decodeStream(data, unpacked_size, tables)
+
+        if len(data) < 12:
+            raise ValueError("Huffman jump table is truncated")
+        sizes = list(struct.unpack_from('<III', data, 0))
+        sizes.append(len(data) - 12 - sum(sizes))
+        # every bitstream ends with at least a padding byte
+        if min(sizes) < 1:
+            raise ValueError("Huffman jump table is invalid")
 
         output = bytearray()
+        offset = 12
+        for size, count in zip(sizes, self.streamCounts(unpacked_size)):
+            output += self.decodeStream(data[offset:offset + size], count, tables)
+            offset += size
+        return output
+
+    # decode unpacked_size symbols of a bitstream (without header) with the tables of buildDecodeTable()
+    def decodeStream(self, data, unpacked_size, tables):
+
+        peek, secondary, peekbits, maxbits = tables
+        peekmask = (1 << peekbits) - 1
+        submask = (1 << (maxbits - peekbits)) - 1
+
+        # the stream, padded so the bit buffer can always be refilled with whole words
+        stream = bytes(data) + bytes(8)
+        if (len(stream) - 8) * 8 < unpacked_size:
+            # every code is at least 1 bit
+            raise ValueError("Huffman data is truncated")
 
+        output = bytearray(unpacked_size)
+
+        # bit buffer, the next bit of the stream is bit (numbitsbuffered - 1)
         bitbuffer = 0
         numbitsbuffered = 0
-        code = 0
-        code_size = 0
+        currentbyte = 0
 
-        firstCodeWithNumBits = 0
-        startIndexForCurrentNumBits = 0
+        for n in range(unpacked_size):
 
-        sourceindex = 0
-        unpacked = 0
-        while unpacked < unpacked_size:
+            # keep at least maxbits in the bitbuffer, 7 bytes at a time
+            if numbitsbuffered < maxbits:
+                bitbuffer = ((bitbuffer & ((1 << numbitsbuffered) - 1)) << 56) | int.from_bytes(stream[currentbyte:currentbyte + 7], 'big')
+                currentbyte += 7
+                numbitsbuffered += 56
 
-            # keep the bitbuffer going
-            if numbitsbuffered == 0:
-                # we're out of data, so any wip codes are invalid due to byte padding.
-                bitbuffer = data[currentbyte]
-                currentbyte += 1
-                numbitsbuffered += 8
+            entry = peek[(bitbuffer >> (numbitsbuffered - peekbits)) & peekmask]
+            bitlength = entry & 31
+            if bitlength == 0:
+                # long code, look up the following bits in the secondary table
+                entry = secondary[(entry >> 5) + ((bitbuffer >> (numbitsbuffered - maxbits)) & submask)]
+                bitlength = entry & 31
+                if bitlength == 0:
+                    raise ValueError("Huffman data is invalid")
 
-            # get a bit
-            bit = (bitbuffer & 128) >> 7
-            bitbuffer <<= 1
-            numbitsbuffered -= 1
+            output[n] = entry >> 5
+            numbitsbuffered -= bitlength
 
-            # build code
-            code = (code << 1) | bit
-            code_size += 1
+        # codes must not run into the padding
+        if currentbyte - (numbitsbuffered >> 3) > len(stream) - 8:
+            raise ValueError("Huffman data is truncated")
 
-            # how many canonical codes have this many bits
-            assert code_size <= self.MAX_CODE_BIT_LENGTH
-            numCodes = length_table[code_size]
+        return output
+
+    # encode large inputs in chunks of chunkSize bytes, so each chunk's table adapts to the local statistics
+    # a chunk reuses the table of the previous chunk if that is smaller than a new table and header, or is stored if coding doesn't help
+    # the chunks are encoded by 'workers' processes at the same time (None means one per CPU)
+    # Returns a bytearray() with the format:
+    #       [4 bytes][Uncompressed data size]
+    #       [4 bytes][Chunk size]
+    #       per chunk:
+    #       [1 byte][Chunk type: CHUNK_NEW_TABLE, CHUNK_PREVIOUS_TABLE or CHUNK_STORED]
+    #       [4 bytes][Size of the chunk data]
+    #       [Chunk data] - new table: as emitted by encode() with header, previous table: the data only, stored: the chunk itself
+    # streams = 4 codes each chunk as 4 bitstreams (CHUNK_INTERLEAVED is added to the chunk type)
+    def encodeChunked(self, phrase, chunkSize = CHUNK_SIZE, workers = 1, streams = 1):
+
+        phrase = self.toBytes(phrase)
+        assert 0 < chunkSize <= self.MAX_CHUNK_SIZE
+        assert streams in (1, self.INTERLEAVED_STREAMS)
+        # jump table and padding bytes of the extra bitstreams
+        streamsSize = 0 if streams == 1 else 12 + streams - 1
+
+        # choose the type of each chunk, tables are cheap to build compared to encoding
+        jobs = []
+        previous = None
+        for start in range(0, len(phrase), chunkSize):
+            chunk = phrase[start:start + chunkSize]
+            huffman = Huffman(self.maxCodeLength)
+            huffman.build(chunk)
+
+            # (size in bytes, chunk type) of each option, on equal sizes the previous table wins, then a new table
+            # encode() always emits a final (padding) byte
+            options = [ (len(chunk), self.CHUNK_STORED) ]
+            if 256 not in huffman.table_bitlengths:
+                options.append( (huffman.headerSize() + huffman.encodedSize(huffman.frequency) // 8 + 1 + streamsSize, self.CHUNK_NEW_TABLE) )
+            if previous is not None and all(previous.lengths[symbol] > 0 for symbol in huffman.frequency):
+                options.append( (previous.encodedSize(huffman.frequency) // 8 + 1 + streamsSize, self.CHUNK_PREVIOUS_TABLE) )
+            chunkType = min(options, key=lambda x: (x[0], x[1] != self.CHUNK_PREVIOUS_TABLE, x[1]))[1]
+
+            if chunkType == self.CHUNK_NEW_TABLE:
+                previous = huffman
+            jobs.append( (chunkType, None if chunkType == self.CHUNK_STORED else previous, chunk) )
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        if workers <= 1 or len(jobs) <= 1:
+            results = [ encodeChunk(*job, streams) for job in jobs ]
+        else:
+            # views can't be pickled, each chunk is copied when it's sent to its worker
+            with concurrent.futures.ProcessPoolExecutor(max_workers = min(workers, len(jobs))) as executor:
+                results = list(executor.map(encodeChunk, [job[0] for job in jobs], [job[1] for job in jobs], [bytes(job[2]) for job in jobs], [streams] * len(jobs)))
 
-            # if input code so far is within the range of the first code with the current number of bits, it's a match
-            indexForCurrentNumBits = code - firstCodeWithNumBits
-            if indexForCurrentNumBits < numCodes:
-                code = startIndexForCurrentNumBits + indexForCurrentNumBits
+        output = bytearray(struct.pack('<II', len(phrase), chunkSize))
+        for job, data in zip(jobs, results):
+            chunkType = job[0]
+            if streams != 1 and chunkType != self.CHUNK_STORED:
+                chunkType |= self.CHUNK_INTERLEAVED
+            output += struct.pack('<BI', chunkType, len(data)) + data
 
-                symbol = symbol_table[code]
-                output.append(symbol)
-                expected = source[sourceindex]
-                assert symbol == expected
-                sourceindex += 1
+        if self.VERBOSE:
+            types = [job[0] for job in jobs]
+            print(" " + str(len(jobs)) + " chunks: " + str(types.count(self.CHUNK_NEW_TABLE)) + " new tables, " + str(types.count(self.CHUNK_PREVIOUS_TABLE)) + " reused tables, " + str(types.count(self.CHUNK_STORED)) + " stored")
 
-                code = 0
-                code_size = 0
+        return output
 
-                firstCodeWithNumBits = 0
-                startIndexForCurrentNumBits = 0      
+    # decode the output of encodeChunked(), returns a bytearray of the decoded data
+    def decodeChunked(self, data):
 
-                unpacked += 1          
+        data = memoryview(data).cast('B')
+        if len(data) < 8:
+            raise ValueError("Huffman chunk header is truncated")
+        unpacked_size, chunkSize = struct.unpack_from('<II', data, 0)
+        if chunkSize == 0:
+            raise ValueError("Huffman chunk size is invalid")
 
+        output = bytearray()
+        tables = None
+        offset = 8
+        while len(output) < unpacked_size:
+            if offset + 5 > len(data):
+                raise ValueError("Huffman chunk header is truncated")
+            chunkType, size = struct.unpack_from('<BI', data, offset)
+            offset += 5
+            chunk = data[offset:offset + size]
+            offset += size
+            if len(chunk) != size:
+                raise ValueError("Huffman chunk is truncated")
+
+            expected = min(chunkSize, unpacked_size - len(output))
+            streams = self.INTERLEAVED_STREAMS if chunkType & self.CHUNK_INTERLEAVED else 1
+            chunkType &= ~self.CHUNK_INTERLEAVED
+            if chunkType == self.CHUNK_NEW_TABLE:
+                count, tables, header_size, streams = self.readHeader(chunk)
+                if count != expected:
+                    raise ValueError("Huffman chunk size mismatch")
+                output += self.decodeStreams(chunk[header_size:], count, tables, streams)
+            elif chunkType == self.CHUNK_PREVIOUS_TABLE:
+                if tables is None:
+                    raise ValueError("Huffman chunk refers to a missing table")
+                output += self.decodeStreams(chunk, expected, tables, streams)
+            elif chunkType == self.CHUNK_STORED:
+                if size != expected:
+                    raise ValueError("Huffman chunk size mismatch")
+                output += chunk
             else:
-                # otherwise, move to the next bit length
-                firstCodeWithNumBits = (firstCodeWithNumBits + numCodes) << 1
-                startIndexForCurrentNumBits += numCodes
+                raise ValueError("Huffman chunk type " + str(chunkType) + " is unknown")
 
-        assert len(output) == len(source)
-        assert output == source
+        return output
 
-        if self.VERBOSE:
-            print(" Test decode OK.")
+    # size in bytes of the header emitted by addHeader()
+    def headerSize(self):
+        return 6 + max(self.lengths) + len(self.table_symbols)
+
+    # size in bits of the data with the given symbol counts, encoded with this instance's codes
+    def encodedSize(self, frequency):
+        return sum(count * self.lengths[symbol] for symbol, count in frequency.items())
+
+    # pickle support (needed by worker processes), the tree isn't needed for encoding
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["heap"] = None
+        return state
+
+
+# encode a chunk for encodeChunked(), runs in a worker process
+def encodeChunk(chunkType, huffman, chunk, streams):
+    if chunkType == Huffman.CHUNK_STORED:
+        return bytes(chunk)
+    return bytes(huffman.encode(chunk, header = chunkType == Huffman.CHUNK_NEW_TABLE, streams = streams))
 
 
 
@@ -346,6 +677,10 @@ if __name__ == '__main__':
 
     parser.add_argument("input", help="read from file [input]")
     parser.add_argument("output", help="output to file [output]")
+    parser.add_argument("-l", "--maxlength", type=int, default=Huffman.MAX_CODE_BIT_LENGTH, metavar="bits", help="Limit the length of the codes (1-" + str(Huffman.MAX_CODE_BIT_LENGTH) + "), default: " + str(Huffman.MAX_CODE_BIT_LENGTH))
+    parser.add_argument("-k", "--chunksize", type=int, default=0, metavar="bytes", help="Split the input into chunks of this size with their own tables, see encodeChunked() (0 means a single table), default: 0")
+    parser.add_argument("-j", "--jobs", type=int, default=1, metavar="int", help="Encode chunks with this many processes (0 means one per CPU), default: 1")
+    parser.add_argument("-i", "--interleave", help="Split the data into 4 bitstreams with a jump table, so they can be decoded independently", action="store_true")
     parser.add_argument("-v", "--verbose", help="Enable verbose mode", action="store_true")
     args = parser.parse_args()
 
@@ -363,11 +698,23 @@ if __name__ == '__main__':
     # load the file
     src_data = bytearray(open(src, "rb").read())
 
-    huffman = Huffman()
+    if args.maxlength < 1 or args.maxlength > Huffman.MAX_CODE_BIT_LENGTH:
+        print("ERROR: Code length limit must be between 1 and " + str(Huffman.MAX_CODE_BIT_LENGTH))
+        sys.exit()
+
+    if args.chunksize < 0 or args.chunksize > Huffman.MAX_CHUNK_SIZE:
+        print("ERROR: Chunk size must be between 0 and " + str(Huffman.MAX_CHUNK_SIZE))
+        sys.exit()
+
+    huffman = Huffman(maxCodeLength = args.maxlength)
     huffman.VERBOSE = args.verbose
-    huffman.build(src_data)
+    streams = Huffman.INTERLEAVED_STREAMS if args.interleave else 1
 
-    dst_data = huffman.encode( src_data, header = True ) 
+    if args.chunksize > 0:
+        dst_data = huffman.encodeChunked( src_data, chunkSize = args.chunksize, workers = args.jobs if args.jobs > 0 else None, streams = streams )
+    else:
+        huffman.build(src_data)
+        dst_data = huffman.encode( src_data, header = True, streams = streams ) 
 
     open(dst, "wb").write(dst_data)
 
@@ -0,0 +1,471 @@
+#!/usr/bin/env python
+# lz4dec.py
+# Python LZ4 decompression module, decodes the frames written by lz4enc.py (and any other LZ4 encoder)
+# By Simon Morris (https://github.com/simondotm/)
+# See https://github.com/simondotm/lz4enc-python
+#
+# Copyright (c) 2019 Simon Morris. All rights reserved.
+#
+# "MIT License":
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import struct
+import os
+import sys
+import argparse
+import concurrent.futures
+
+from xxhash32 import xxhash32, XXHash32
+
+from timeit import default_timer as timer
+
+
+# LZ4 decoder for the frame format (see https://github.com/lz4/lz4/blob/dev/doc/lz4_Frame_format.md)
+# every token is decoded in one step: literals are copied as one slice, overlapping matches repeat their pattern
+# instead of being copied byte by byte
+class LZ4Decoder():
+
+  # magic bytes of an LZ4 frame
+  FrameMagic     = 0x184D2204
+  # skippable frames use 0x184D2A50 ... 0x184D2A5F
+  SkippableMagic = 0x184D2A50
+  # a block size with this bit set means the block is stored uncompressed
+  UncompressedFlag = 0x80000000
+  # maximum block size as defined in LZ4 spec, indexed by the block size ID
+  MaxBlockSizes = { 4: 64*1024, 5: 256*1024, 6: 1024*1024, 7: 4*1024*1024 }
+  # each match's length must be >= 4
+  MinMatch       =  4
+  # dictionaries (and the history of dependent blocks) are limited to the LZ4 window
+  MaxDictionary  = 65536
+  # number of bytes used to store match distances, 2 is the LZ4 default
+  # 1 decodes the 8-bit offsets of LZ4.optimizedCompression() (non-compliant LZ4 streams)
+  DistanceByteSize = 2
+
+  Verbose = False
+
+  def __init__(self, distanceByteSize = 2):
+    self.DistanceByteSize = distanceByteSize
+
+  #-------------------------------------------------------------------------------------------------
+  # parse an LZ4 frame header (as written by LZ4.beginFrame) starting at data[offset]
+  # returns a dictionary with the frame settings and the offset of the frame's first block
+  #-------------------------------------------------------------------------------------------------
+  def readFrameHeader(self, data, offset = 0):
+    if (len(data) < offset + 7):
+      raise ValueError("LZ4 frame header is truncated")
+
+    magic = struct.unpack_from('<I', data, offset)[0]
+    if (magic != self.FrameMagic):
+      raise ValueError("not an LZ4 frame (magic bytes 0x%08X)" % magic)
+
+    # (7-6) Version (5) B.Indep (4) B.Checksum (3) C.Size (2) C.Checksum (1) Reserved (0) DictID
+    flags = data[offset + 4]
+    if ((flags >> 6) != 1):
+      raise ValueError("unsupported LZ4 frame version " + str(flags >> 6))
+
+    blockSizeId = (data[offset + 5] >> 4) & 7
+    if (blockSizeId not in self.MaxBlockSizes):
+      raise ValueError("invalid LZ4 block size ID " + str(blockSizeId))
+
+    frame = {
+      "blockIndependence" : (flags & 0x20) != 0,
+      "blockChecksum"     : (flags & 0x10) != 0,
+      "contentChecksum"   : (flags & 0x04) != 0,
+      "maxBlockSize"      : self.MaxBlockSizes[blockSizeId],
+      "contentSize"       : None,
+      "dictId"            : None,
+    }
+
+    descriptor = offset + 4
+    offset += 6
+    if (flags & 0x08):
+      frame["contentSize"] = struct.unpack_from('<Q', data, offset)[0]
+      offset += 8
+    if (flags & 0x01):
+      frame["dictId"] = struct.unpack_from('<I', data, offset)[0]
+      offset += 4
+
+    # header checksum: second byte of the descriptor's xxHash32
+    if (offset >= len(data)):
+      raise ValueError("LZ4 frame header is truncated")
+    checksum = (xxhash32(memoryview(data)[descriptor:offset]) >> 8) & 0xFF
+    if (data[offset] != checksum):
+      raise ValueError("LZ4 frame header checksum mismatch")
+    offset += 1
+
+    return frame, offset
+
+  #-------------------------------------------------------------------------------------------------
+  # decode a single compressed LZ4 block and append it to output
+  # output must already contain the history (previous blocks and/or the dictionary) the block refers to
+  #-------------------------------------------------------------------------------------------------
+  def decompressBlock(self, block, output):
+    MinMatch = self.MinMatch
+    distanceBytes = self.DistanceByteSize
+    pos = 0
+    end = len(block)
+
+    while (pos < end):
+      token = block[pos]
+      pos += 1
+
+      # ----- literals -----
+      numLiterals = token >> 4
+      if (numLiterals == 15):
+        while (True):
+          if (pos >= end):
+            raise ValueError("LZ4 block is truncated (literal length)")
+          extra = block[pos]
+          pos += 1
+          numLiterals += extra
+          if (extra != 255):
+            break
+
+      if (numLiterals > 0):
+        if (pos + numLiterals > end):
+          raise ValueError("LZ4 block is truncated (literals)")
+        output += block[pos:pos + numLiterals]
+        pos += numLiterals
+
+      # the last token has literals only
+      if (pos == end):
+        break
+
+      # ----- match -----
+      if (pos + distanceBytes > end):
+        raise ValueError("LZ4 block is truncated (match distance)")
+      if (distanceBytes == 2):
+        distance = block[pos] | (block[pos + 1] << 8)
+      else:
+        distance = int.from_bytes(block[pos:pos + distanceBytes], 'little')
+      pos += distanceBytes
+
+      matchLength = (token & 15) + MinMatch
+      if (matchLength == 15 + MinMatch):
+        while (True):
+          if (pos >= end):
+            raise ValueError("LZ4 block is truncated (match length)")
+          extra = block[pos]
+          pos += 1
+          matchLength += extra
+          if (extra != 255):
+            break
+
+      start = len(output) - distance
+      if (distance == 0 or start < 0):
+        raise ValueError("invalid LZ4 match distance " + str(distance))
+
+      if (matchLength <= distance):
+        output += output[start:start + matchLength]
+      else:
+        # overlapping match: the last 'distance' bytes are repeated
+        pattern = output[start:]
+        output += (pattern * (matchLength // distance + 1))[:matchLength]
+
+    return output
+
+  #-------------------------------------------------------------------------------------------------
+  # read the block (and its checksum) of the current frame at data[offset]
+  # returns the block data, whether it's uncompressed and the offset of the next block (block is None at the end mark)
+  #-------------------------------------------------------------------------------------------------
+  def readBlock(self, data, offset, frame):
+    if (offset + 4 > len(data)):
+      raise ValueError("LZ4 frame is truncated (block size)")
+    blockSize = struct.unpack_from('<I', data, offset)[0]
+    offset += 4
+
+    # end mark
+    if (blockSize == 0):
+      return None, False, offset
+
+    uncompressed = (blockSize & self.UncompressedFlag) != 0
+    blockSize &= ~self.UncompressedFlag
+    if (blockSize > frame["maxBlockSize"] or offset + blockSize > len(data)):
+      raise ValueError("LZ4 block is truncated or too large (" + str(blockSize) + " bytes)")
+    block = memoryview(data)[offset:offset + blockSize]
+    offset += blockSize
+
+    # block checksum: xxHash32 of the block data as stored
+    if (frame["blockChecksum"]):
+      if (offset + 4 > len(data)):
+        raise ValueError("LZ4 frame is truncated (block checksum)")
+      if (struct.unpack_from('<I', data, offset)[0] != xxhash32(block)):
+        raise ValueError("LZ4 block checksum mismatch")
+      offset += 4
+
+    return block, uncompressed, offset
+
+  # compare the content checksum at data[offset] with the hash of the decoded frame, returns the offset behind it
+  def checkContent(self, data, offset, frame, contentHash):
+    if (frame["contentChecksum"]):
+      if (offset + 4 > len(data)):
+        raise ValueError("LZ4 frame is truncated (content checksum)")
+      if (contentHash is not None and struct.unpack_from('<I', data, offset)[0] != contentHash.intdigest()):
+        raise ValueError("LZ4 content checksum mismatch")
+      offset += 4
+    return offset
+
+  #-------------------------------------------------------------------------------------------------
+  # decode all blocks of the frame whose first block starts at data[offset]
+  # decoded bytes are appended to output, returns the offset behind the frame
+  #-------------------------------------------------------------------------------------------------
+  def decompressFrame(self, data, offset, frame, output, dictionary = bytearray()):
+    outputStart = len(output)
+
+    # only the most recent 64k of the dictionary can be referenced
+    prefix = bytearray(memoryview(dictionary)[-self.MaxDictionary:]) if len(dictionary) > 0 else bytearray()
+
+    # dependent blocks refer to the most recent 64k of previously decoded data of this frame
+    history = bytearray(prefix)
+
+    # all decoded data is hashed if the frame has a content checksum
+    contentHash = XXHash32() if frame["contentChecksum"] else None
+
+    while (True):
+      block, uncompressed, offset = self.readBlock(data, offset, frame)
+      if (block is None):
+        break
+
+      if (frame["blockIndependence"]):
+        history = bytearray(prefix)
+
+      if LZ4Decoder.Verbose:
+        print(" Decoding block of " + str(len(block)) + " bytes" + (" (uncompressed)" if uncompressed else ""))
+
+      # each block is decoded behind the history, then moved to the output
+      historySize = len(history)
+      if (uncompressed):
+        history += block
+      else:
+        self.decompressBlock(block, history)
+      output += memoryview(history)[historySize:]
+      if (contentHash is not None):
+        contentHash.update(memoryview(history)[historySize:])
+
+      # keep only the window for the next block
+      if (not frame["blockIndependence"] and len(history) > self.MaxDictionary):
+        del history[:len(history) - self.MaxDictionary]
+
+    offset = self.checkContent(data, offset, frame, contentHash)
+
+    if (frame["contentSize"] is not None and len(output) - outputStart != frame["contentSize"]):
+      raise ValueError("LZ4 frame size mismatch, decoded " + str(len(output) - outputStart) + " bytes instead of " + str(frame["contentSize"]))
+
+    return offset
+
+  #-------------------------------------------------------------------------------------------------
+  # decompress a complete LZ4 stream (one or more frames, as written by LZ4.compress)
+  # use the same dictionary as the compressor
+  # returns a bytearray with the decompressed data
+  #-------------------------------------------------------------------------------------------------
+  def decompress(self, data, dictionary = bytearray()):
+    data = memoryview(data).cast('B')
+    output = bytearray()
+    offset = 0
+
+    while (offset < len(data)):
+      magic = struct.unpack_from('<I', data, offset)[0] if offset + 4 <= len(data) else None
+
+      # skippable frames contain user data, just jump over them
+      if (magic is not None and (magic & 0xFFFFFFF0) == self.SkippableMagic):
+        if (offset + 8 > len(data)):
+          raise ValueError("LZ4 skippable frame is truncated")
+        offset += 8 + struct.unpack_from('<I', data, offset + 4)[0]
+        continue
+
+      frame, offset = self.readFrameHeader(data, offset)
+      offset = self.decompressFrame(data, offset, frame, output, dictionary)
+
+    return output
+
+  #-------------------------------------------------------------------------------------------------
+  # check the header and block checksums of a complete LZ4 stream without decoding it (much faster)
+  # content checksums can't be checked without decoding, frames without block checksums pass unchecked
+  # raises a ValueError if the stream is corrupt, returns the number of checked blocks
+  #-------------------------------------------------------------------------------------------------
+  def verifyBlocks(self, data):
+    data = memoryview(data).cast('B')
+    offset = 0
+    checked = 0
+
+    while (offset < len(data)):
+      magic = struct.unpack_from('<I', data, offset)[0] if offset + 4 <= len(data) else None
+
+      # skippable frames contain user data, just jump over them
+      if (magic is not None and (magic & 0xFFFFFFF0) == self.SkippableMagic):
+        if (offset + 8 > len(data)):
+          raise ValueError("LZ4 skippable frame is truncated")
+        offset += 8 + struct.unpack_from('<I', data, offset + 4)[0]
+        continue
+
+      frame, offset = self.readFrameHeader(data, offset)
+      while (True):
+        block, uncompressed, offset = self.readBlock(data, offset, frame)
+        if (block is None):
+          break
+        if (frame["blockChecksum"]):
+          checked += 1
+      offset = self.checkContent(data, offset, frame, None)
+
+    return checked
+
+
+#-------------------------------------------------------------------------------------------------
+# decode a compressed file and compare it with its original (if originalName isn't None)
+# returns None if the file is fine, otherwise a description of the error
+#-------------------------------------------------------------------------------------------------
+def verifyFile(compressedName, originalName = None, dictionary = bytearray(), distanceByteSize = 2):
+  try:
+    with open(compressedName, 'rb') as fh:
+      decoded = LZ4Decoder(distanceByteSize).decompress(fh.read(), dictionary)
+    if (originalName is not None):
+      with open(originalName, 'rb') as fh:
+        if (decoded != fh.read()):
+          return "decoded data differs from '" + originalName + "'"
+  except (ValueError, OSError) as e:
+    return str(e)
+  return None
+
+#-------------------------------------------------------------------------------------------------
+# verify many compressed files at once, split across worker processes (None means one per CPU)
+# each file is compared with its original, i.e. its name without '.lz4', if that exists
+# returns a list of (compressedName, error) for each file, error is None if the file is fine
+#-------------------------------------------------------------------------------------------------
+def verifyFiles(compressedNames, dictionary = bytearray(), distanceByteSize = 2, workers = None):
+  originalNames = []
+  for name in compressedNames:
+    original = name[:-4] if name.endswith(".lz4") else None
+    originalNames.append(original if original is not None and os.path.isfile(original) else None)
+
+  count = len(compressedNames)
+  if workers is None:
+    workers = os.cpu_count() or 1
+
+  if (workers <= 1 or count <= 1):
+    errors = map(verifyFile, compressedNames, originalNames, [dictionary] * count, [distanceByteSize] * count)
+    return list(zip(compressedNames, errors))
+
+  # assets are usually small, so each worker gets a batch of files at once
+  chunksize = max(1, count // (workers * 4))
+  with concurrent.futures.ProcessPoolExecutor(max_workers = min(workers, count)) as executor:
+    errors = executor.map(verifyFile, compressedNames, originalNames, [bytes(dictionary)] * count, [distanceByteSize] * count, chunksize = chunksize)
+    return list(zip(compressedNames, errors))
+
+
+#-------------------------
+# main()
+#-------------------------
+
+def main(args):
+
+  start_time = timer()
+
+  # enable verbose mode
+  LZ4Decoder.Verbose = args.verbose
+
+  dictionary = bytearray()
+  if args.dict:
+    dictionary = bytearray(open(args.dict, 'rb').read())
+
+  distanceByteSize = 1 if args.optimized else 2
+
+  # check for missing files
+  for src in args.input:
+    if not os.path.isfile(src):
+      print("ERROR: File '" + src + "' not found")
+      sys.exit()
+
+  # batch verification
+  if args.test:
+    workers = args.jobs
+    if workers == 0:
+      workers = None
+    results = verifyFiles(args.input, dictionary, distanceByteSize, workers)
+
+    failed = 0
+    for name, error in results:
+      if error is not None:
+        failed += 1
+        print("FAILED: '" + name + "' - " + error)
+      elif LZ4Decoder.Verbose:
+        print("OK: '" + name + "'")
+
+    print("Verified " + str(len(results)) + " files, " + str(failed) + " failed")
+    if failed > 0:
+      sys.exit(1)
+
+  else:
+    if args.output != None and len(args.input) > 1:
+      print("ERROR: -o can only be used with a single input file")
+      sys.exit()
+
+    for src in args.input:
+      dst = args.output
+      if dst == None:
+        if src.endswith(".lz4"):
+          dst = src[:-4]
+        else:
+          dst = src + ".out"
+
+      if os.path.isfile(dst) and not args.force:
+        print("ERROR: File '" + dst + "' already exists, use -f to overwrite it")
+        sys.exit()
+
+      # load the compressed file
+      fh = open(src, 'rb')
+      file_in = fh.read()
+      fh.close()
+
+      decoder = LZ4Decoder(distanceByteSize)
+      file_out = decoder.decompress(file_in, dictionary)
+
+      fh = open(dst, 'wb')
+      fh.write(file_out)
+      fh.close()
+
+      print("Decompressed " + str(len(file_in)) + " bytes into " + str(len(file_out)) + " bytes")
+
+  end_time = timer()
+
+  if LZ4Decoder.Verbose:
+    t = '{:.2f}'.format(end_time-start_time)
+    print("Completed in " + t + "s.")
+
+#--------------------------------
+
+# Determine if running as a script
+if __name__ == '__main__':
+
+  print("lz4dec.py : LZ4 decompressor, fully compatible with LZ4 by Yann Collet (see https://lz4.org)")
+  print("Written in 2019 by Simon M, https://github.com/simondotm/")
+  print("")
+
+  parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter)
+
+  parser.add_argument("input", nargs="+", help="read from file(s) [input]")
+  parser.add_argument("-o", "--output", help="write to file [output] (default is [input] without '.lz4')")
+  parser.add_argument("-D", "--dict", metavar="file", help="Load dictionary file")
+  parser.add_argument("-f", "--force", help="Overwrite an existing file", action="store_true")
+  parser.add_argument("-O", "--optimized", help="Decode 8-bit match offsets (see LZ4.optimizedCompression)", action="store_true")
+  parser.add_argument("-t", "--test", help="Verify the input files instead of writing them, each is compared with its original ([input] without '.lz4') if that exists", action="store_true")
+  parser.add_argument("-j", "--jobs", type=int, default=0, metavar="int", help="Verify with this many processes (0 means one per CPU), default: 0")
+  parser.add_argument("-v", "--verbose", help="Enable verbose mode", action="store_true")
+  args = parser.parse_args()
+
+  main(args)
@@ -36,9 +36,30 @@ import struct
 import os
 import sys
 import argparse
-
+import array
+import operator
+import contextlib
+import concurrent.futures
+import copy
+import mmap
+import json
+import tracemalloc
+
+# NumPy is optional, it is only used to vectorize some of the compressor's passes
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# shared memory (Python 3.8+) passes the hash chains of registered dictionaries to worker processes, they are pickled otherwise
+try:
+  from multiprocessing import shared_memory
+except ImportError:
+  shared_memory = None
+
+from xxhash32 import xxhash32, XXHash32
 from timeit import default_timer as timer
-import profile
+import cProfile
 
 # LZ4 compression with optimal parsing, based on smallz4, refactored for more general purpose use within Python scripts.
 class LZ4():
@@ -65,6 +86,8 @@ class LZ4():
   BlockEndLiterals  =  5
   # match finder's hash table size (2^HashBits entries, must be less than 32)
   HashBits          = 20
+  # match finder's hash function multiplier, taken from https://en.wikipedia.org/wiki/Linear_congruential_generator
+  HashMultiplier    = 22695477
   # input buffer size, can be any number but zero ;-)
   BufferSize     = 64*1024
   # maximum match distance
@@ -77,9 +100,10 @@ class LZ4():
   MaxSameLetter  =   19 + 255*256 # was: 19 + 255
   # refer to location of the previous match (implicit hash chain)
   PreviousSize   = 1 << 16
-  # maximum block size as defined in LZ4 spec: { 0,0,0,0,64*1024,256*1024,1024*1024,4*1024*1024 }
-  # I only work with the biggest maximum block size (7)
-  #  note: xxhash header checksum is precalculated only for 7, too
+  # only the most recent 64k of a dictionary can be referenced
+  MaxDictionary  = 65536
+  # maximum block size as defined in LZ4 spec, indexed by the block size ID (4 ... 7), see setBlockSize()
+  BlockSizes     = [ 0, 0, 0, 0, 64*1024, 256*1024, 1024*1024, 4*1024*1024 ]
   MaxBlockSizeId = 7
   MaxBlockSize   = 4*1024*1024
 
@@ -89,9 +113,49 @@ class LZ4():
   # Note that changing this value will create non-compliant LZ4 data streams and require a customized decompressor
   DistanceByteSize = 2
 
+  # match finder engines, selected with setCompression()
+  # hash chains are used by all compression levels (default)
+  MatchFinderHashChain   = "hashchain"
+  # suffix array + LCP array, finds the same matches as the hash chains but much faster for optimal parsing (level 9 only)
+  MatchFinderSuffixArray = "suffixarray"
+  # binary search tree per hash bucket (like LZMA's bt4), O(log window) per position, used by all compression levels
+  MatchFinderBinaryTree  = "bt4"
+  MatchFinders = [ MatchFinderHashChain, MatchFinderSuffixArray, MatchFinderBinaryTree ]
+  # binary tree search depth per compression level (one tree step is worth many hash chain steps)
+  TreeDepthPerLevel = 8
+  # binary trees are sorted by this many bytes of each position, a match this long ends the search (like LZMA's nice length)
+  TreeNiceLength = 273
+
+  # use NumPy (if installed) to vectorize the hash chain construction and cost estimation, results are identical either way
+  UseNumpy = True
+  # estimateCosts() evaluates shorter matches without NumPy
+  NumpyMinLength = 32
+
   # Verbose mode
   Verbose = False
 
+  # progress phases, see setProgress()
+  # finding matches for each position of a block
+  PhaseMatching = "matching"
+  # optimal parsing: cost estimation of each position, from the end of the block to its start
+  PhaseCosts    = "costs"
+  # a block is finished (always reported, fraction is 1.0)
+  PhaseBlock    = "block"
+
+  # what is recorded in LZ4.stats, see setStats()
+  # nothing (except for the metrics, see setMetrics())
+  StatsNone     = 0
+  # counters only: number of tokens, largest offset and length, ...
+  StatsCounters = 1
+  # counters and the separate output streams (tokens, offsets, lengths, literals)
+  StatsStreams  = 2
+
+  # phase times of each block, see setMetrics()
+  MetricsTimes = ["hashChainTime", "findLongestMatchTime", "estimateCostsTime", "selectBestMatchesTime"]
+
+  # class-level settings which are passed to worker processes, too
+  PickledClassSettings = ["MaxBlockSize", "MaxBlockSizeId", "BufferSize", "HashBits", "UseNumpy", "NumpyMinLength", "TreeDepthPerLevel", "TreeNiceLength"]
+
   # Debug mode
   Debug = False
 
@@ -103,7 +167,24 @@ class LZ4():
   #-------------------------------------------------------------------------------------------------
   def __init__(self, level = 9):
     self.setCompression(level)
-    self.stats = {}
+    self.independentBlocks(False)
+    self.verifyCompression(False)
+    self.storeContentSize(False)
+    self.setChecksums(False, False)
+    # registered dictionaries by their ID, see registerDictionary()
+    self.dictionaries = {}
+    self.setDictionary(None)
+    # hash of the current frame's uncompressed data (if it has a content checksum), see beginFrame()
+    self.contentHash = None
+    self.setProgress(None)
+    self.setMetrics(False)
+    self.setStats(self.StatsCounters)
+    # index of the current block within the frame (for progress reports)
+    self.blockIndex = 0
+    # hash tables, allocated by the first compressBlock() and reused afterwards
+    self.lastHash = None
+    self.treeNodes = None
+    self.nextPosition = 0
 
   #-------------------------------------------------------------------------------------------------
   # The encoder tracks compression statistics to enable output analysis
@@ -112,21 +193,27 @@ class LZ4():
   #-------------------------------------------------------------------------------------------------
   def resetStats(self):
     self.stats = {}
-    # OLD COMMENT matchLength can be 4 + 14 + 254 in 12-bits = 272
-    self.stats["tokenCount"] = 0      # number of tokens in this block
-    self.stats["largestOffset"] = 0   # largest stored match distance in this block
-    self.stats["largestLength"] = 0   # largest stored match length in this block
-    self.stats["byteOffsetCount"] = 0 # number of match distances that were 255 or less
-    self.stats["sameOffsetCount"] = 0 # number of match distances that were the same as the previous one
-    self.stats["lastOffset"] = -1     # temporary var for tracking the last match distance
-
-    # Gather LZ4 output data streams as separate blocks rather than the usual interleaved output (useful for creating custom formats)
-    # Inspired by LZ5, more optimal non-LZ4 compatible output formats can be created by huffman encoding this data. 
-    self.stats["tokens"] = []         # array of tokens stored in this block
-    self.stats["offsets"] = []        # array of offsets (match distances) stored in this block
-    self.stats["lengths"] = []        # array of match lengths stored in this block
-    self.stats["literal_bytes"] = []  # array of literals byte stream data (as per LZ5)
-    self.stats["lengths_bytes"] = []  # array of lengths byte stream data (as per LZ5) - literal lengths first, then match lengths (where length stored in the token was 15)
+    if (self.statsLevel >= self.StatsCounters):
+      # OLD COMMENT matchLength can be 4 + 14 + 254 in 12-bits = 272
+      self.stats["tokenCount"] = 0      # number of tokens in this block
+      self.stats["largestOffset"] = 0   # largest stored match distance in this block
+      self.stats["largestLength"] = 0   # largest stored match length in this block
+      self.stats["byteOffsetCount"] = 0 # number of match distances that were 255 or less
+      self.stats["sameOffsetCount"] = 0 # number of match distances that were the same as the previous one
+      self.stats["lastOffset"] = -1     # temporary var for tracking the last match distance
+      self.stats["firstOffset"] = -1    # temporary var for merging the stats of independent blocks (see mergeStats)
+
+    if (self.statsLevel >= self.StatsStreams):
+      # Gather LZ4 output data streams as separate blocks rather than the usual interleaved output (useful for creating custom formats)
+      # Inspired by LZ5, more optimal non-LZ4 compatible output formats can be created by huffman encoding this data. 
+      self.stats["tokens"] = bytearray()         # tokens stored in this block
+      self.stats["offsets"] = array.array('H')   # offsets (match distances) stored in this block, 0 for the last token
+      self.stats["lengths"] = array.array('i')   # match lengths minus 4 stored in this block (negative for the last token)
+      self.stats["literal_bytes"] = bytearray()  # literals byte stream data (as per LZ5)
+      self.stats["lengths_bytes"] = bytearray()  # lengths byte stream data (as per LZ5) - literal lengths first, then match lengths (where length stored in the token was 15)
+
+    # per block metrics, only if enabled by LZ4.setMetrics() (see LZ4.getMetrics() for the totals)
+    self.stats["blocks"] = []
     
 
   #-------------------------------------------------------------------------------------------------
@@ -259,14 +346,617 @@ class LZ4():
       result.length   = compare - current
     
     return result
-  
+
+  #-------------------------------------------------------------------------------------------------
+  # return the number of identical bytes at data[a] and data[b], starting at offset length and stopping at limit
+  # compares exponentially growing slices, then narrows down to the first mismatch
+  #-------------------------------------------------------------------------------------------------
+  def matchLength(self, data, a, b, length, limit):
+    step = 4
+    while (length + step <= limit and data[a + length:a + length + step] == data[b + length:b + length + step]):
+      length += step
+      step <<= 1
+    while (step > 1):
+      step >>= 1
+      if (length + step <= limit and data[a + length:a + length + step] == data[b + length:b + length + step]):
+        length += step
+    return length
+
+  #-------------------------------------------------------------------------------------------------
+  # insert data[pos] into the binary tree of its hash bucket and find the longest match on the way (bt4)
+  # the tree is sorted by the first TreeNiceLength bytes of the suffixes starting at each position, the most recent
+  # position is the root, therefore nodes are visited from the closest to the most distant one and the closest of the
+  # longest matches wins, the search stops at the first match of TreeNiceLength bytes (which is extended up to end)
+  # positions less than TreeNiceLength bytes before known can't be sorted yet, they are searched but not inserted
+  # returns a Match object
+  #
+  # data - bytearray
+  # pos, begin, end - int
+  # known - end of the data read so far
+  # last - previous position with the same hash (root of the tree), NoLastHash if none
+  # nodes - list/array of two children per position (modulo PreviousSize)
+  #-------------------------------------------------------------------------------------------------
+  def findLongestMatchBinaryTree(self, data, pos, begin, end, known, last, nodes):
+    NoNode = 0x7FFFFFFF
+
+    result = self.Match()
+    result.length = 1
+
+    # pointer to position that is matched against everything in data
+    current = pos - begin
+    # don't match beyond this point
+    limit = end - pos
+    # don't compare beyond this point
+    nice = self.TreeNiceLength
+    insert = (known - pos >= nice)
+    if (not insert):
+      nice = known - pos
+
+    # pending child slots of the nodes that are smaller / greater than the current position
+    smaller = (pos % self.PreviousSize) << 1
+    greater = smaller + 1
+    # number of bytes the nodes behind these slots share with the current position
+    smallerLength = 0
+    greaterLength = 0
+
+    # compression level: limit the depth of the tree search
+    stepsLeft = self.maxChainLength * self.TreeDepthPerLevel
+
+    candidate = last
+    while (True):
+      distance = pos - candidate
+      if (candidate == NoNode or candidate < begin or distance > self.MaxDistance or stepsLeft <= 0):
+        if (insert):
+          nodes[smaller] = NoNode
+          nodes[greater] = NoNode
+        break
+      stepsLeft -= 1
+
+      # both subtrees share at least this many bytes with the current position
+      length = min(smallerLength, greaterLength)
+      compare = candidate - begin
+      length = self.matchLength(data, current, compare, length, nice)
+
+      # store new best match
+      if (min(length, limit) > result.length):
+        result.length = min(length, limit)
+        result.distance = distance
+
+      node = (candidate % self.PreviousSize) << 1
+      if (length >= nice):
+        # identical as far as the tree is sorted, the current position replaces the older one
+        if (insert):
+          nodes[smaller] = nodes[node]
+          nodes[greater] = nodes[node + 1]
+        break
+
+      if (data[compare + length] < data[current + length]):
+        # continue with the greater suffixes of the candidate
+        if (insert):
+          nodes[smaller] = candidate
+        smaller = node + 1
+        smallerLength = length
+        candidate = nodes[smaller]
+      else:
+        # continue with the smaller suffixes of the candidate
+        if (insert):
+          nodes[greater] = candidate
+        greater = node
+        greaterLength = length
+        candidate = nodes[greater]
+
+    # the tree doesn't know anything beyond the nice length
+    if (result.length >= nice and limit > nice):
+      result.length = self.matchLength(data, current, current - result.distance, nice, limit)
+
+    return result
+
+  #-------------------------------------------------------------------------------------------------
+  # build the suffix array of data by prefix doubling (Manber-Myers with Larsson-Sadakane style
+  # refinement of the unsorted groups only)
+  # returns a list of suffix start offsets in lexicographic order, and the inverse (rank) array
+  #
+  # data - bytearray
+  #-------------------------------------------------------------------------------------------------
+  def buildSuffixArray(self, data):
+    n = len(data)
+    if n == 0:
+      return [], array.array('i')
+
+    # initial sort key is the first four bytes (zero padded), shorter suffixes sort first on a tie
+    padded = bytes(data) + bytes(3)
+    words = [0] * n
+    for o in range(4):
+      count = (n - o + 3) >> 2
+      words[o::4] = struct.unpack_from('>' + str(count) + 'L', padded, o)
+    keys = [four * 5 + 4 for four in words]
+    for i in range(max(0, n - 3), n):
+      keys[i] -= 4 - (n - i)
+
+    sa = sorted(range(n), key=keys.__getitem__)
+
+    # rank of a suffix is the index of the first member of its group
+    # groups with more than one member are still unsorted
+    rank = array.array('i', [0]) * n
+    groups = []
+    start = 0
+    previous = keys[sa[0]]
+    for k in range(1, n):
+      key = keys[sa[k]]
+      if key != previous:
+        if k - start > 1:
+          groups.append((start, k))
+        start = k
+        previous = key
+      rank[sa[k]] = start
+    if n - start > 1:
+      groups.append((start, n))
+    del keys, words
+
+    # each pass doubles the number of sorted bytes
+    h = 4
+    while groups:
+      # rank of the suffix h bytes further, -1 beyond the end (shorter suffixes first)
+      shifted = rank[h:] + array.array('i', [-1]) * min(h, n)
+      unsorted = []
+      for start, end in groups:
+        members = sa[start:end]
+        members.sort(key=shifted.__getitem__)
+        sa[start:end] = members
+
+        # split the group where the second half of the key changes
+        first = start
+        previous = shifted[members[0]]
+        for k in range(1, len(members)):
+          key = shifted[members[k]]
+          if key != previous:
+            if start + k - first > 1:
+              unsorted.append((first, start + k))
+            first = start + k
+            previous = key
+          rank[members[k]] = first
+        if end - first > 1:
+          unsorted.append((first, end))
+
+      groups = unsorted
+      h <<= 1
+
+    return sa, rank
+
+  #-------------------------------------------------------------------------------------------------
+  # build the LCP array using Kasai's algorithm
+  # lcp[k] is the length of the longest common prefix of the suffixes sa[k-1] and sa[k], lcp[0] is 0
+  #-------------------------------------------------------------------------------------------------
+  def buildLcpArray(self, data, sa, rank):
+    n = len(data)
+    lcp = array.array('i', [0]) * n
+    h = 0
+    for i in range(n):
+      r = rank[i]
+      if r == 0:
+        h = 0
+        continue
+      j = sa[r - 1]
+      while i + h < n and j + h < n and data[i + h] == data[j + h]:
+        h += 1
+      lcp[r] = h
+      if h > 0:
+        h -= 1
+    return lcp
+
+  #-------------------------------------------------------------------------------------------------
+  # build a segment tree for range minimum / maximum queries (function is min or max)
+  # tree[size + k] is values[k] (padded with fill), tree[i] combines its children tree[2i] and tree[2i+1]
+  #
+  # values - array of ints
+  # size - number of leaves, a power of two
+  #-------------------------------------------------------------------------------------------------
+  def buildRangeTree(self, values, size, fill, function):
+    tree = array.array('i', [fill]) * (2 * size)
+    tree[size:size + len(values)] = values
+    level = size
+    while level > 1:
+      tree[level >> 1:level] = array.array('i', map(function, tree[level:2 * level:2], tree[level + 1:2 * level:2]))
+      level >>= 1
+    return tree
+
+  #-------------------------------------------------------------------------------------------------
+  # return the minimum / maximum of the leaves lo ... hi of a segment tree (see buildRangeTree)
+  #-------------------------------------------------------------------------------------------------
+  def rangeMinimum(self, tree, size, lo, hi):
+    result = 0x7FFFFFFF
+    lo += size
+    hi += size + 1
+    while lo < hi:
+      if (lo & 1):
+        if tree[lo] < result:
+          result = tree[lo]
+        lo += 1
+      if (hi & 1):
+        hi -= 1
+        if tree[hi] < result:
+          result = tree[hi]
+      lo >>= 1
+      hi >>= 1
+    return result
+
+  def rangeMaximum(self, tree, size, lo, hi):
+    result = -1
+    lo += size
+    hi += size + 1
+    while lo < hi:
+      if (lo & 1):
+        if tree[lo] > result:
+          result = tree[lo]
+        lo += 1
+      if (hi & 1):
+        hi -= 1
+        if tree[hi] > result:
+          result = tree[hi]
+      lo >>= 1
+      hi >>= 1
+    return result
+
+  #-------------------------------------------------------------------------------------------------
+  # return the closest leaf left / right of leaf k of a maximum segment tree whose value is at least threshold,
+  # -1 if there is none (climbs until a sibling contains such a leaf, then descends to it)
+  #-------------------------------------------------------------------------------------------------
+  def findLeftAtLeast(self, tree, size, k, threshold):
+    i = size + k
+    while i > 1:
+      if ((i & 1) and tree[i - 1] >= threshold):
+        i -= 1
+        while i < size:
+          i = 2 * i + 1
+          if tree[i] < threshold:
+            i -= 1
+        return i - size
+      i >>= 1
+    return -1
+
+  def findRightAtLeast(self, tree, size, k, threshold):
+    i = size + k
+    while i > 1:
+      if (not (i & 1) and tree[i + 1] >= threshold):
+        i += 1
+        while i < size:
+          i = 2 * i
+          if tree[i] < threshold:
+            i += 1
+        return i - size
+      i >>= 1
+    return -1
+
+  #-------------------------------------------------------------------------------------------------
+  # return the range [lo, hi] of suffix array ranks around rank r whose suffixes share at least length bytes
+  # lo is the closest rank <= r with lcp[lo] < length, hi + 1 the closest rank > r with lcp[hi + 1] < length
+  #
+  # lcpTree - minimum segment tree of the LCP array, padded with -1 (see buildRangeTree)
+  # size - number of leaves, larger than the LCP array
+  # length - at least 1 (lcp[0] is 0)
+  #-------------------------------------------------------------------------------------------------
+  def findRankRange(self, lcpTree, size, r, length):
+    i = size + r
+    if lcpTree[i] >= length:
+      while not ((i & 1) and lcpTree[i - 1] < length):
+        i >>= 1
+      i -= 1
+      while i < size:
+        i = 2 * i + 1
+        if lcpTree[i] >= length:
+          i -= 1
+    lo = i - size
+
+    i = size + r + 1
+    if lcpTree[i] >= length:
+      while not (not (i & 1) and lcpTree[i + 1] < length):
+        i >>= 1
+      i += 1
+      while i < size:
+        i = 2 * i
+        if lcpTree[i] >= length:
+          i += 1
+    hi = i - size - 1
+
+    return lo, hi
+
+  #-------------------------------------------------------------------------------------------------
+  # find longest matches for each position of a block using a suffix array instead of the hash chains
+  # produces exactly the same matches as findLongestMatch() with an unlimited chain length:
+  # the longest match within the sliding window and, if there are several, the closest one
+  #
+  # data - bytearray, history followed by the current block
+  # dataBlock - offset of the current block in data
+  # blockSize - int
+  # firstValid - offset of the first byte in data that can be matched against
+  # rehashed - offsets in data which the hash chains processed twice at a block border (see compressBlock)
+  # matchLengths, matchDistances - match table of the current block, modified in place
+  #-------------------------------------------------------------------------------------------------
+  def findMatchesSuffixArray(self, data, dataBlock, blockSize, firstValid, rehashed, matchLengths, matchDistances):
+    text = data[:dataBlock + blockSize]
+    n = len(text)
+
+    if LZ4.Verbose:
+      print("   Building suffix array...")
+    sa, rank = self.buildSuffixArray(text)
+    lcp = self.buildLcpArray(text, sa, rank)
+    del sa
+
+    # all queries are answered by segment trees in O(log n), there is one more leaf than ranks
+    size = 1
+    while size <= n:
+      size <<= 1
+    # minimum LCP between any two ranks
+    lcpTree = self.buildRangeTree(lcp, size, -1, min)
+    del lcp
+    # position stored at each rank once it entered the window (never cleared, older positions are smaller anyway)
+    # the maximum of a range of ranks is its closest position, the window contains only positions >= pos - window
+    newest = array.array('i', [-1]) * (2 * size)
+
+    window = self.MaxDistance
+    for pos in range(max(firstValid, dataBlock - window), dataBlock):
+      i = size + rank[pos]
+      while i > 0:
+        newest[i] = pos
+        i >>= 1
+
+    # a position hashed twice breaks the hash chain of its hash bucket, nothing older can be reached through it
+    HashMultiplier = self.HashMultiplier
+    HashShift = 32 - self.HashBits
+    HashMask = (1 << self.HashBits) - 1
+    barriers = [ (x, ((struct.unpack_from('>L', text, x)[0] * HashMultiplier) >> HashShift) & HashMask) for x in rehashed ]
+
+    # don't match beyond this point
+    stop = n - self.BlockEndLiterals + 1
+
+    progress = self.progressCallback
+
+    for i in range(0, blockSize - self.BlockEndNoMatch + 1):
+      pos = dataBlock + i
+
+      # slide the window (positions only grow, so all parents of the new leaf get its position, too)
+      if i > 0:
+        k = size + rank[pos - 1]
+        while k > 0:
+          newest[k] = pos - 1
+          k >>= 1
+      windowStart = max(pos - window, firstValid)
+
+      # show progress
+      if (progress is not None and (i & 511) == 0):
+        self.reportProgress(self.PhaseMatching, i / blockSize)
+
+      # detect self-matching
+      if (i > 0 and text[pos] == text[pos - 1]):
+        if (matchDistances[i - 1] == 1 and matchLengths[i - 1] > self.MaxSameLetter):
+          matchLengths[i] = matchLengths[i - 1] - 1
+          matchDistances[i] = 1
+          continue
+
+      # the longest match is shared with one of the closest ranks inside the window
+      r = rank[pos]
+      length = 0
+      left = self.findLeftAtLeast(newest, size, r, windowStart)
+      if left >= 0:
+        length = self.rangeMinimum(lcpTree, size, left + 1, r)
+      right = self.findRightAtLeast(newest, size, r, windowStart)
+      if right >= 0:
+        length = max(length, self.rangeMinimum(lcpTree, size, r + 1, right))
+
+      if length > stop - pos:
+        length = stop - pos
+      if length < self.MinMatch:
+        continue
+
+      # closest position among all suffixes sharing at least length bytes
+      lo, hi = self.findRankRange(lcpTree, size, r, length)
+      last = self.rangeMaximum(newest, size, lo, hi)
+
+      # emulate the hash chains: positions behind a broken chain are unreachable
+      oldest = -1
+      if barriers:
+        hash = ((struct.unpack_from('>L', text, pos)[0] * HashMultiplier) >> HashShift) & HashMask
+        for x, barrierHash in barriers:
+          if barrierHash == hash and pos - window <= x < pos and x > oldest:
+            oldest = x
+
+      if last < oldest:
+        # binary search the longest length still having a match at or after the barrier
+        low = self.MinMatch
+        high = length - 1
+        last = -1
+        while low <= high:
+          middle = (low + high) >> 1
+          lo, hi = self.findRankRange(lcpTree, size, r, middle)
+          closest = self.rangeMaximum(newest, size, lo, hi)
+          if closest >= oldest:
+            length = middle
+            last = closest
+            low = middle + 1
+          else:
+            high = middle - 1
+        if last < 0:
+          continue
+
+      matchLengths[i] = length
+      matchDistances[i] = pos - last
+
+  #-------------------------------------------------------------------------------------------------
+  # build the hash chains of count positions byte by byte, exactly like the scalar loop in compressBlocks()
+  # does for the lookback bytes (used to prepare registered dictionaries, see LZ4Dictionary)
+  #
+  # data - bytearray, dataZero - file position of data[0]
+  # first - file position of the first byte to hash, the four bytes of each position must be in data
+  # lastHash - array, last position of each hash, modified in place
+  # previousHash, previousExact - arrays, hash chains (indexed by position % PreviousSize), modified in place
+  #-------------------------------------------------------------------------------------------------
+  def buildHashChains(self, data, dataZero, first, count, lastHash, previousHash, previousExact):
+    NoLastHash = 0x7FFFFFFF
+    HashMultiplier = self.HashMultiplier
+    HashShift = 32 - self.HashBits
+    HashMask = (1 << self.HashBits) - 1
+
+    for pos in range(first, first + count):
+      four = struct.unpack_from('>L', data, pos - dataZero)[0]
+      hash = ((four * HashMultiplier) >> HashShift) & HashMask
+
+      # get last occurrence of these bits and store current position
+      last = lastHash[hash]
+      lastHash[hash] = pos
+
+      # no predecessor or too far away ?
+      prevIndex = pos % self.PreviousSize
+      distance = pos - last
+      if (last == NoLastHash or distance > self.MaxDistance):
+        previousHash[prevIndex] = self.NoPrevious
+        previousExact[prevIndex] = self.NoPrevious
+        continue
+      previousHash[prevIndex] = distance
+
+      # skip pseudo-matches (hash collisions), see compressBlocks()
+      while (distance != self.NoPrevious):
+        curFour = struct.unpack_from('>L', data, last - dataZero)[0]
+        if (curFour == four):
+          break
+
+        curHash = ((curFour * HashMultiplier) >> HashShift) & HashMask
+        if (curHash != hash):
+          distance = self.NoPrevious
+          break
+
+        next = previousHash[last % self.PreviousSize]
+        distance += next
+        if (distance > self.MaxDistance):
+          previousHash[last % self.PreviousSize] = self.NoPrevious
+          distance = self.NoPrevious
+          break
+
+        last -= next
+        if (next == self.NoPrevious or last < dataZero):
+          distance = self.NoPrevious
+          break
+
+      previousExact[prevIndex] = distance
+
+  #-------------------------------------------------------------------------------------------------
+  # build the hash chains of a whole block at once with NumPy instead of byte by byte
+  # produces exactly the same chains as the scalar loop in compressBlock(), the hash chains
+  # of the previous blocks are read from lastHash/previousHash (lookback must be hashed already)
+  #
+  # data - bytearray, history followed by the current block
+  # dataZero - file position of data[0]
+  # lastBlock - file position of the current block's first byte
+  # count - number of positions to hash
+  # lastHash - array, last position of each hash, modified in place
+  # previousHash - array, hash chains of the previous positions
+  #
+  # returns two arrays with count entries: distance to the previous position with the same hash
+  #  and distance to the previous position with the same four bytes (or NoPrevious for both),
+  #  None and None if the block contains very long runs of the same byte
+  #-------------------------------------------------------------------------------------------------
+  def buildHashChainsNumpy(self, data, dataZero, lastBlock, count, lastHash, previousHash):
+    NoLastHash = 0x7FFFFFFF
+    HashShift = 32 - self.HashBits
+    HashMask = (1 << self.HashBits) - 1
+    dataBlock = lastBlock - dataZero
+
+    # read four bytes per position (copied, a view would lock the bytearray's size)
+    raw = numpy.frombuffer(bytes(data[dataBlock:dataBlock + count + 3]), dtype=numpy.uint8).astype(numpy.int64)
+
+    # very long runs of the same byte skip hashing in compressBlock(), leave them to the scalar code
+    changes = numpy.flatnonzero(raw[1:] != raw[:-1])
+    if (numpy.diff(numpy.concatenate(([-1], changes, [len(raw) - 1]))).max() >= self.MaxSameLetter - 8):
+      return None, None
+
+    words = (raw[:count] << 24) | (raw[1:count + 1] << 16) | (raw[2:count + 2] << 8) | raw[3:count + 3]
+    del raw, changes
+    hashes = ((words * self.HashMultiplier) >> HashShift) & HashMask
+    positions = numpy.arange(count, dtype=numpy.int64)
+
+    # group positions by hash, a position's predecessor is the one before it in its group
+    order = numpy.argsort(hashes, kind='stable')
+    sortedHashes = hashes[order]
+    groupBegin = numpy.ones(count, dtype=bool)
+    groupBegin[1:] = sortedHashes[1:] != sortedHashes[:-1]
+    groupEnd = numpy.ones(count, dtype=bool)
+    groupEnd[:-1] = groupBegin[1:]
+    groupId = numpy.cumsum(groupBegin) - 1
+    firsts = order[groupBegin]
+    lasts = order[groupEnd]
+
+    predecessor = numpy.empty(count, dtype=numpy.int64)
+    predecessor[order[1:]] = order[:-1] + lastBlock
+    # the first position of a group continues the hash chain of the previous blocks
+    predecessor[firsts] = numpy.frombuffer(lastHash, dtype=lastHash.typecode)[hashes[firsts]]
+
+    # no predecessor or too far away ?
+    hashDistance = positions + lastBlock - predecessor
+    linked = (predecessor != NoLastHash) & (hashDistance <= self.MaxDistance)
+    hashDistance[~linked] = self.NoPrevious
+
+    # a hash chain can't be followed beyond a position without predecessor, find the most recent one (or -1)
+    offset = groupId * (count + 1)
+    lastBroken = numpy.empty(count, dtype=numpy.int64)
+    lastBroken[order] = numpy.maximum.accumulate(offset + numpy.where(linked[order], 0, order + 1)) - offset - 1
+    groupFirst = numpy.empty(count, dtype=numpy.int64)
+    groupFirst[order] = firsts[groupId]
+    del order, sortedHashes, groupBegin, groupEnd, groupId, offset, linked
+
+    # previous position with the same four bytes, it's always part of the same hash chain
+    order = numpy.argsort(words, kind='stable')
+    same = words[order[1:]] == words[order[:-1]]
+    previous = numpy.full(count, -1, dtype=numpy.int64)
+    previous[order[1:][same]] = order[:-1][same]
+
+    exactDistance = positions - previous
+    found = (previous >= 0) & (lastBroken <= previous) & (exactDistance <= self.MaxDistance)
+    exactDistance[~found] = self.NoPrevious
+    del order, same, found
+
+    # and store each hash's most recent position
+    for hash, i in zip(hashes[lasts].tolist(), lasts.tolist()):
+      lastHash[hash] = i + lastBlock
+
+    # compact results, distances always fit into 16 bits
+    hashChains = array.array('H', hashDistance.astype(numpy.uint16).tobytes())
+    exactChains = array.array('H', exactDistance.astype(numpy.uint16).tobytes())
+    del hashDistance, exactDistance
+
+    # these four bytes didn't show up in the current block before: walk the previous blocks' hash chain
+    unseen = numpy.flatnonzero((previous < 0) & (lastBroken < 0))
+    unseenWords = words[unseen].tolist()
+    unseenHashes = hashes[unseen].tolist()
+    unseenLast = predecessor[groupFirst[unseen]].tolist()
+    for i, four, hash, last in zip(unseen.tolist(), unseenWords, unseenHashes, unseenLast):
+      distance = i + lastBlock - last
+      if (distance > self.MaxDistance):
+        continue
+
+      while (True):
+        curFour = struct.unpack('>L', data[last - dataZero:last - dataZero + 4])[0]
+        # actual match found, first 4 bytes are identical
+        if (curFour == four):
+          exactChains[i] = distance
+          break
+        # prevent from accidently hopping on an old, wrong hash chain
+        if ((((curFour * self.HashMultiplier) >> HashShift) & HashMask) != hash):
+          break
+        # try next pseudo-match
+        next = previousHash[last % self.PreviousSize]
+        distance += next
+        last -= next
+        if (distance > self.MaxDistance or next == self.NoPrevious or last < dataZero):
+          break
+
+    return hashChains, exactChains
+
   #-------------------------------------------------------------------------------------------------
   # create shortest output
   #  data points to block's begin; we need it to extract literals
   #
   # returns bytearray
   #-------------------------------------------------------------------------------------------------
-  def selectBestMatches(self, matches, data, index):
+  def selectBestMatches(self, matchLengths, matchDistances, data, index):
     # store encoded data
     result = bytearray()
 
@@ -274,15 +964,38 @@ class LZ4():
     literalsFrom = 0
     literalsTo   = 0 # point beyond last literal of the current run
 
+    # stats (see setStats), counters are kept in local variables until the block is finished
+    stats = self.stats
+    counters = (self.statsLevel >= self.StatsCounters)
+    streams = (self.statsLevel >= self.StatsStreams)
+    if (counters):
+      tokenCount = stats["tokenCount"]
+      largestOffset = stats["largestOffset"]
+      largestLength = stats["largestLength"]
+      byteOffsetCount = stats["byteOffsetCount"]
+      sameOffsetCount = stats["sameOffsetCount"]
+      lastOffset = stats["lastOffset"]
+    if (streams):
+      tokens = stats["tokens"]
+      offsets = stats["offsets"]
+      lengths = stats["lengths"]
+      literalBytes = stats["literal_bytes"]
+      lengthsBytes = stats["lengths_bytes"]
+
     # walk through the whole block
+    blockEnd = len(matchLengths)
     offset = 0
-    while (offset < len(matches)): # increment inside of loop
+    while (offset < blockEnd): # increment inside of loop
 
       # get best cost-weighted match
       match = self.Match()
-      match.length = matches[offset].length
-      match.distance = matches[offset].distance
-      
+      match.length = matchLengths[offset]
+      match.distance = matchDistances[offset]
+
+      # match must not cross block borders (greedy mode skips estimateCosts, which usually takes care of this)
+      if (match.isMatch() and offset + match.length + self.BlockEndLiterals > blockEnd):
+        match.length = blockEnd - (offset + self.BlockEndLiterals)
+
       # debug output
       if self.Debug:
         print("offset="+str(offset)+", length="+str(match.length)+", distance="+str(match.distance))
@@ -301,7 +1014,7 @@ class LZ4():
       
       offset += match.length
 
-      lastToken = (offset == len(matches))
+      lastToken = (offset == blockEnd)
       # continue if simple literal
       if (not match.isMatch() and not lastToken):
         continue
@@ -327,11 +1040,12 @@ class LZ4():
           token |= 15
 
       result.append( token ) #struct.pack('B', token) )
-      self.stats["tokens"].append( token )
-
-      self.stats["tokenCount"] += 1    
-      self.stats["offsets"].append( match.distance )
-      self.stats["lengths"].append( matchLength )
+      if (counters):
+        tokenCount += 1
+      if (streams):
+        tokens.append( token )
+        offsets.append( match.distance )
+        lengths.append( matchLength )
 
 
       # >= 15 literals ? (extra bytes to store length)
@@ -342,20 +1056,22 @@ class LZ4():
         # emit 255 until remainder is below 255
         while (numLiterals >= 255):       
           result.append(255)
-          self.stats["lengths_bytes"].append(255)
+          if (streams):
+            lengthsBytes.append(255)
           numLiterals -= 255
         
         # and the last byte (can be zero, too)
         result.append(numLiterals)
-        self.stats["lengths_bytes"].append(numLiterals)
+        if (streams):
+          lengthsBytes.append(numLiterals)
       
       # copy literals
       if (literalsFrom != literalsTo):
       
         subset = data[index + literalsFrom:index + literalsTo]
         result.extend( subset )
-        for z in subset:
-          self.stats["literal_bytes"].append(z)
+        if (streams):
+          literalBytes.extend( subset )
 
         literalsFrom = 0
         literalsTo = 0
@@ -365,15 +1081,18 @@ class LZ4():
         break
 
       # stats
-      if match.distance > self.stats["largestOffset"]:
-        self.stats["largestOffset"] = match.distance
-      if matchLength > self.stats["largestLength"]:
-        self.stats["largestLength"] = matchLength
-      if match.distance < 256:
-        self.stats["byteOffsetCount"] += 1
-      if match.distance == self.stats["lastOffset"]:
-        self.stats["sameOffsetCount"] += 1
-      self.stats["lastOffset"] = match.distance
+      if (counters):
+        if match.distance > largestOffset:
+          largestOffset = match.distance
+        if matchLength > largestLength:
+          largestLength = matchLength
+        if match.distance < 256:
+          byteOffsetCount += 1
+        if match.distance == lastOffset:
+          sameOffsetCount += 1
+        if lastOffset == -1:
+          stats["firstOffset"] = match.distance
+        lastOffset = match.distance
 
       # distance stored as 1 or two bytes in data stream
       if self.DistanceByteSize == 1:
@@ -394,14 +1113,26 @@ class LZ4():
         # emit 255 until remainder is below 255
         while (matchLength >= 255):
           result.append(255)
-          self.stats["lengths_bytes"].append(255)
+          if (streams):
+            lengthsBytes.append(255)
           matchLength -= 255
         
         # and the last byte (can be zero, too)
         result.append(matchLength)
-        self.stats["lengths_bytes"].append(matchLength)
+        if (streams):
+          lengthsBytes.append(matchLength)
       
 
+    if (not counters):
+      return result
+
+    stats["tokenCount"] = tokenCount
+    stats["largestOffset"] = largestOffset
+    stats["largestLength"] = largestLength
+    stats["byteOffsetCount"] = byteOffsetCount
+    stats["sameOffsetCount"] = sameOffsetCount
+    stats["lastOffset"] = lastOffset
+
     # debug output
     if LZ4.Debug:
       print("    largestOffset=" + str(largestOffset))
@@ -416,11 +1147,21 @@ class LZ4():
   # walk backwards through all matches and compute number of compressed bytes from current position to the end of the block
   #  note: matches are modified (shortened length) if necessary
   #-------------------------------------------------------------------------------------------------
-  def estimateCosts(self, matches):
-    blockEnd = len(matches)
+  def estimateCosts(self, matchLengths, matchDistances):
+    blockEnd = len(matchLengths)
 
     # minimum cost from this position to the end of the current block
-    cost = [0] * len(matches)
+    cost = [0] * blockEnd
+
+    # cost of a match depending on its length: token (1 byte) + offset (1 or 2 bytes) + very long matches need extra bytes
+    maxLength = max(max(matchLengths, default = 0), self.MinMatch)
+    matchCost = [1 + self.DistanceByteSize + (0 if length < 19 else 1 + (length - 19) // 255) for length in range(maxLength + 1)]
+
+    # NumPy pays off for long matches only
+    useNumpy = (numpy is not None and self.UseNumpy and maxLength >= self.NumpyMinLength)
+    if (useNumpy):
+      numpyCost = numpy.zeros(blockEnd, dtype=numpy.int64)
+      numpyMatchCost = numpy.array(matchCost, dtype=numpy.int64)
     
     # "cost" represents the number of bytes needed
     # backwards optimal parsing
@@ -428,12 +1169,12 @@ class LZ4():
 
     # ignore the last 5 bytes, they are always literals
     blockRange = blockEnd - (1 + self.BlockEndLiterals)
+    progress = self.progressCallback
     for i in range(blockRange, -1, -1 ): # lower range is -1 so we hit 0
 
       # show progress
-      if (i & 511) == 0:
-        sys.stdout.write("   Calculating cost data " + str(100-int(i*100/(blockRange))) + "%...\r")
-        sys.stdout.flush()
+      if (progress is not None and (i & 511) == 0):
+        self.reportProgress(self.PhaseCosts, 1 - i / blockRange)
 
       # watch out for long literal strings that need extra bytes
       numLiterals = posLastMatch - i
@@ -447,27 +1188,36 @@ class LZ4():
       bestLength = 1
 
       # analyze longest match
-      match = self.Match()
-      match.length = matches[i].length
-      match.distance = matches[i].distance    
-      
+      length = matchLengths[i]
+
       # match must not cross block borders
-      if (match.isMatch() and i + match.length + self.BlockEndLiterals > blockEnd):
-        match.length = blockEnd - (i + self.BlockEndLiterals)
+      if (length >= self.MinMatch and i + length + self.BlockEndLiterals > blockEnd):
+        length = blockEnd - (i + self.BlockEndLiterals)
 
-      # try all match lengths (first short ones)
-      for length in range(self.MinMatch, match.length+1):
-      
-        # token (1 byte) + offset (1 or 2 bytes)
-        currentCost = cost[i + length] + 1 + self.DistanceByteSize # might be 1 byte offset cost instead of 2
+      # workaround: very long self-referencing matches can slow down the program A LOT
+      if (matchDistances[i] == 1 and length >= self.MaxSameLetter):
+
+        # assume that longest match is always the best match
+        # however, this assumption might not be optimal
+        bestLength = length
+        minCost    = cost[i + length] + matchCost[length]
+
+      # try all match lengths at once
+      elif (length >= self.MinMatch):
+
+        if (useNumpy and length >= self.NumpyMinLength):
+          candidates = numpyCost[i + self.MinMatch:i + length + 1] + numpyMatchCost[self.MinMatch:length + 1]
+          currentCost = int(candidates.min())
+          # the last one of the cheapest lengths
+          longest = length - int(numpy.argmin(candidates[::-1]))
+        else:
+          candidates = list(map(operator.add, cost[i + self.MinMatch:i + length + 1], matchCost[self.MinMatch:length + 1]))
+          currentCost = min(candidates)
+          longest = length - candidates[::-1].index(currentCost)
 
-        # very long matches need extra bytes for encoding match length
-        if (length >= 19):
-          currentCost += 1 + (length - 19) / 255
-        
         # better choice ?
         if (currentCost <= minCost):
-        
+
           # regarding the if-condition:
           # "<"  prefers literals and shorter matches
           # "<=" prefers longer matches
@@ -479,56 +1229,78 @@ class LZ4():
           # if there are many literal in front of the current position
           # then it may be better to emit a match with the same cost as the literals at the current position
           # => it "breaks" the long chain of literals and removes the extra length byte
+          # that's why the longest of all lengths with the lowest cost is chosen
           minCost    = currentCost
-          bestLength = length
+          bestLength = longest
           # performance-wise, a long match is usually faster during decoding than multiple short matches
           # on the other hand, literals are faster than short matches as well (assuming same cost)
-        
-        # workaround: very long self-referencing matches can slow down the program A LOT
-        if (match.distance == 1 and match.length >= self.MaxSameLetter):
-        
-          # assume that longest match is always the best match
-          # however, this assumption might not be optimal
-          bestLength = match.length
-          minCost    = cost[i + match.length] + 1 + self.DistanceByteSize + 1 + (match.length - 19) / 255
-          break
-        
-      
+
       # remember position of last match to detect number of consecutive literals
       if (bestLength >= self.MinMatch):
         posLastMatch = i
 
       # store lowest cost so far
       cost[i] = minCost
+      if (useNumpy):
+        numpyCost[i] = minCost
       # and adjust best match
-      matches[i].length = bestLength
+      matchLengths[i] = bestLength
       if (bestLength == 1):
-        matches[i].distance = self.NoPrevious
+        matchDistances[i] = self.NoPrevious
 
-      # note: if bestLength is smaller than the previous matches[i].length then there might be a closer match
+      # note: if bestLength is smaller than the previous matchLengths[i] then there might be a closer match
       #       which could be more cache-friendly (=> faster decoding)
     
+  #-------------------------------------------------------------------------------------------------
+  # prepare the hash table (last position of each hash) and the binary tree nodes for the next input
+  # instead of clearing both tables, the positions of the next input simply start far enough behind
+  # the previous input so that all old entries are outside of the window (compressBlocks() keeps track
+  # of that); the tables are only reallocated if positions wouldn't fit anymore (or HashBits changed)
+  #
+  # size - number of bytes the caller is going to hash (input and dictionary), None if unknown (streaming)
+  #
+  # returns the position of the new input's first byte, always a multiple of PreviousSize
+  #-------------------------------------------------------------------------------------------------
+  def reuseHashTables(self, size):
+    NoLastHash = 0x7FFFFFFF
+
+    # 32 bit positions, unless the input is huge or of unknown size
+    fits = (self.lastHash is not None and len(self.lastHash) == (1 << self.HashBits) and
+            (self.lastHash.typecode == 'q' or (size is not None and self.nextPosition + size < NoLastHash)))
+    if (not fits):
+      typecode = 'i'
+      if (size is None or size >= NoLastHash):
+        typecode = 'q'
+      self.lastHash = array.array(typecode, [NoLastHash]) * (1 << self.HashBits)
+      self.treeNodes = array.array(typecode, [NoLastHash]) * (2 * self.PreviousSize)
+      self.nextPosition = 0
+
+    return self.nextPosition
+
   #--------------------------------------------------------------------------------------------------------------------------------
   # create an LZ4 compressed block from the input buffer
   # return the compressed block as an output buffer
   # improve compression with a predefined dictionary
   #--------------------------------------------------------------------------------------------------------------------------------
-  # inputData, and dictionary are bytearray's
+  # inputData, and dictionary are bytearray's (or any other buffer: bytes, memoryview, mmap, NumPy arrays)
   # returns a bytearray containing the compressed LZ4 stream
   def compressBlock(self, inputData, dictionary = bytearray()):
 
-    outputData = bytearray()
+    # the input is only read through views, it's never copied as a whole
+    inputData = memoryview(inputData).cast('B')
 
-    # write a byte array to the output buffer, data can be a byte or a byte array
-    def sendBytes(data):
-      if len(data) == 1:
-        outputData.append(data)
-      else:
-        outputData.extend(data)
+    # independent blocks are compressed one by one (or in parallel)
+    if (self.blockIndependence and len(inputData) > self.MaxBlockSize):
+      return self.compressIndependentBlocks(inputData, dictionary)
 
-    # read upto count bytes from the input buffer, returned in a new bytearray 'buffer'. Returns an empty buffer if no more data available.
+    # initialise getByte read stream
+    inputPointer = 0
+
+    # read upto count bytes from the input buffer, returned as a memoryview 'buffer'. Returns an empty buffer if no more data available.
+    # (the read position is a plain closure variable, so the input isn't kept alive by a reference cycle - an mmap can be closed right after)
     def getBytes(count):
-      ptr = getBytes.inputPointer
+      nonlocal inputPointer
+      ptr = inputPointer
       if ptr >= len(inputData):
         return bytearray()
       else:
@@ -536,42 +1308,93 @@ class LZ4():
           count = len(inputData) - ptr
 
         buf = inputData[ptr:ptr+count]
-        getBytes.inputPointer = ptr + count
+        inputPointer = ptr + count
         return buf
 
-    # initialise getByte read stream
-    getBytes.inputPointer = 0
-   
+    outputData = bytearray()
+    for block in self.compressBlocks(getBytes, len(inputData), dictionary):
+      outputData.extend(block)
+
+    return outputData
+
+  #--------------------------------------------------------------------------------------------------------------------------------
+  # the block loop behind compressBlock() and LZ4Stream, yields each compressed block (including its size) as a bytearray
+  # improve compression with a predefined dictionary
+  #--------------------------------------------------------------------------------------------------------------------------------
+  # getBytes(count) returns upto count bytes of input, an empty buffer at the end of the input
+  #  or None if there is no input yet: then None is yielded, too, and the generator waits to be resumed with
+  #  send(False) once there is more input or with send(True) to compress everything read so far as a (shorter) block
+  # size is the number of input bytes (None if unknown)
+  def compressBlocks(self, getBytes, size, dictionary = bytearray()):
+    # tracemalloc runs while the frame is compressed if the metrics need it, it's stopped again even if the
+    # generator is closed early or fails (unless it was started by someone else)
+    startedTracing = (self.collectMetrics and self.traceMemory and not tracemalloc.is_tracing())
+    if (startedTracing):
+      tracemalloc.start()
+    try:
+      yield from self.compressBlockLoop(getBytes, size, dictionary)
+    finally:
+      if (startedTracing):
+        tracemalloc.stop()
+
+  #--------------------------------------------------------------------------------------------------------------------------------
+  # the actual block loop of compressBlocks()
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def compressBlockLoop(self, getBytes, size, dictionary):
+
+    # write a byte array to the output buffer, data can be a byte or a byte array
+    def sendBytes(data):
+      outputData.extend(data)
+
+    # without a dictionary, the one selected by setDictionary() is used (its hash chains are already built)
+    registered = None
+    if (self.dictID is not None):
+      assert len(dictionary) == 0, "a dictionary was selected by setDictionary() already"
+      registered = self.dictionaries[self.dictID]
+      dictionary = registered.data
+
     # ==================== declarations ====================
+    # last time we saw a hash, binary trees (bt4 match finder) share the hash table's last occurrences as their roots,
+    # both tables are reused from the previous call, positions continue where the previous input ended
+    if (size is not None and len(dictionary) > 0):
+      size += 65536
+    streamStart = self.reuseHashTables(size)
+    lastHash = self.lastHash
+    NoLastHash = 0x7FFFFFFF
+
     # read the file in chunks/blocks, data will contain only bytes which are relevant for the current block
     data = bytearray()
     # file position corresponding to data[0]
-    dataZero = 0
+    dataZero = streamStart
     # last already read position
-    numRead  = 0
+    numRead  = streamStart
     # passthru data (but still wrap in LZ4 format)
     uncompressed = (self.maxChainLength == 0)
-    # last time we saw a hash
     HashSize   = 1 << self.HashBits
-    NoLastHash = 0x7FFFFFFF
-
-    lastHash = [NoLastHash] * HashSize
 
-    HashMultiplier = 22695477 # taken from https:#en.wikipedia.org/wiki/Linear_congruential_generator
+    HashMultiplier = self.HashMultiplier
     HashShift  = 32 - self.HashBits # uint8
     
-    # previous position which starts with the same bytes
-    previousHash = [self.NoPrevious] * self.PreviousSize
-    previousExact = [self.NoPrevious] * self.PreviousSize
+    # previous position which starts with the same bytes (distances always fit into 16 bits)
+    previousHash = array.array('H', bytes(2 * self.PreviousSize))
+    previousExact = array.array('H', bytes(2 * self.PreviousSize))
+
+    # binary trees: two children per position, smaller suffixes first, then greater suffixes
+    useBinaryTree = (self.matchFinder == self.MatchFinderBinaryTree)
+    treeNodes = self.treeNodes
+    # first position which isn't inserted into the binary trees yet (see findLongestMatchBinaryTree)
+    treePending = streamStart
     
     
     # change buffer size as you like
     buffer = bytearray(self.BufferSize)
 
     # first and last offset of a block (next is end-of-block plus 1)
-    lastBlock = 0
-    nextBlock = 0
+    lastBlock = streamStart
+    nextBlock = streamStart
     parseDictionary = len(dictionary) > 0
+    # positions hashed twice at block borders
+    rehashed = []
 
     while (True):
     
@@ -587,28 +1410,38 @@ class LZ4():
           print(" Loading Dictionary...")
 
         # prepend exactly 64k
-        MaxDictionary = 65536
+        MaxDictionary = self.MaxDictionary
         if (len(dictionary) < MaxDictionary):
-          # add garbage data
-          unused = 65536 - len(dictionary)
+          # add garbage data, followed by the dictionary
+          unused = MaxDictionary - len(dictionary)
           data.extend( bytearray(unused) )
+          data.extend( dictionary )
         else:
           # copy only the most recent 64k of the dictionary
           doffset = len(dictionary) - MaxDictionary
-          data.extend( bytearray( dictionary[doffset:]) )
+          data.extend( memoryview(dictionary)[doffset:] )
 
-        nextBlock = len(data)
-        numRead   = len(data)
+        nextBlock = streamStart + len(data)
+        numRead   = streamStart + len(data)
       
       # read more bytes from input
       maxBlockSize = self.MaxBlockSize
 
 
 
+      flushing = False
       while (numRead - nextBlock < maxBlockSize):
       
         # buffer can be significantly smaller than MaxBlockSize, that's the only reason for this while-block
         buffer = getBytes(self.BufferSize)
+
+        # no input yet (streaming), wait for more or for being flushed
+        if (buffer is None):
+          flushing = yield None
+          if (flushing):
+            break
+          continue
+
         incoming = len(buffer)
         if (incoming == 0):
           break
@@ -616,12 +1449,17 @@ class LZ4():
 
         data.extend( buffer )
       
-      # no more data ? => WE'RE DONE !
+      # no more data ? => WE'RE DONE ! (unless a stream was flushed without any new data)
       if (nextBlock == numRead):
+        if (flushing):
+          continue
         break
 
+      # positions of the next input must start behind this one (see reuseHashTables)
+      self.nextPosition = (numRead // self.PreviousSize + 2) * self.PreviousSize
+
       if LZ4.Verbose:
-        print(" Processing Block... " + str(numRead>>10) + "Kb, (maxBlockSize=" + str(maxBlockSize>>10) + "Kb, windowSize=" + str(self.MaxDistance>>10) + "Kb)")
+        print(" Processing Block... " + str((numRead - streamStart)>>10) + "Kb, (maxBlockSize=" + str(maxBlockSize>>10) + "Kb, windowSize=" + str(self.MaxDistance>>10) + "Kb)")
 
       # determine block borders
       lastBlock  = nextBlock
@@ -651,157 +1489,255 @@ class LZ4():
       lazyEvaluation = False
 
       # the last literals of the previous block skipped matching, so they are missing from the hash chains
-      lookback = dataZero
+      lookback = dataZero - streamStart
       if (lookback > self.BlockEndNoMatch and (parseDictionary == False)):
         lookback = self.BlockEndNoMatch
 
       if (parseDictionary):
-        lookback = len(dictionary)
+        lookback = min(len(dictionary), self.MaxDictionary)
+
+        # the hash chains of a registered dictionary are copied, only its last few bytes are hashed here
+        # (blocks shorter than BlockEndNoMatch don't hash all of the dictionary, they don't have any matches anyway)
+        if (registered is not None and not useBinaryTree and not uncompressed and blockSize >= self.BlockEndNoMatch):
+          registered.apply(self, streamStart, lastHash, previousHash, previousExact)
+          lookback = min(lookback, LZ4Dictionary.UnprimedBytes)
+
+      # note: the first of these bytes was already hashed in the previous block, its hash chain ends there
+      if (lookback == self.BlockEndNoMatch and parseDictionary == False):
+        rehashed.append(lastBlock - lookback)
+
+      # the binary trees still miss the last positions of the previous block (if they are within the window)
+      if (useBinaryTree):
+        if (parseDictionary):
+          treePending = lastBlock - lookback
+        lookback = max(0, min(lastBlock - treePending, lastBlock - dataZero))
 
       # so let's go back a few bytes
       lookback = -lookback
  
-      matches = [ self.Match() for i in range(blockSize) ]
+      # match table: length and distance of the longest match found for each position (no Match objects, saves lots of memory)
+      matchLengths = array.array('I', [0]) * blockSize
+      matchDistances = array.array('H', [0]) * blockSize
+
+      # time spent in each phase of this block (see setMetrics), the clock isn't read at all if disabled
+      metrics = None
+      if (self.collectMetrics):
+        metrics = { "bytesIn": blockSize, "bytesOut": 0, "peakMemory": None }
+        for name in self.MetricsTimes:
+          metrics[name] = 0.0
+        if (self.traceMemory and tracemalloc.is_tracing()):
+          tracemalloc.reset_peak()
+        startTime = timer()
+
+      # the suffix array finds the same matches as unlimited hash chains (optimal parsing), but much faster
+      useSuffixArray = (self.matchFinder == self.MatchFinderSuffixArray and self.maxChainLength > self.MaxDistance and not uncompressed)
+      if useSuffixArray:
+        firstValid = 0
+        if (parseDictionary):
+          firstValid = max(0, dataBlock - len(dictionary))
+        self.findMatchesSuffixArray(data, dataBlock, blockSize, firstValid, [x - dataZero for x in rehashed if x >= dataZero], matchLengths, matchDistances)
+
+        # the suffix array has no hash chains, building it is part of the match search
+        if (metrics is not None):
+          metrics["findLongestMatchTime"] = timer() - startTime
 
-      # find longest matches for each position
-      for i in range(lookback, blockSize):
+      else:
 
-        # show progress
-        if (i & 511) == 0 or i == (blockSize - 1):
-          sys.stdout.write("   Scanning block data " + str(int(i*100/(blockSize-1))) + "%...\r")
-          sys.stdout.flush()
+        # NumPy builds the same hash chains much faster (not needed by the binary trees)
+        useNumpy = (numpy is not None and self.UseNumpy and not useBinaryTree and not uncompressed)
+        hashChains = None
+        exactChains = None
+        # time spent in findLongestMatch (or inserting into the binary trees), everything else of this loop builds hash chains
+        findTime = 0.0
 
-        # no matches at the end of the block (or matching disabled by command-line option -0 )
-        if (i + self.BlockEndNoMatch > blockSize or uncompressed):
-          continue
-      
-        # detect self-matching
-        if (i > 0 and data[dataBlock + i] == data[dataBlock + i - 1]):
+        # find longest matches for each position
+        progress = self.progressCallback
+        for i in range(lookback, blockSize):
 
-          prevMatch = matches[i - 1]  # Python version of prevMatch is a reference not an instance
-          
-          # predecessor had the same match ?
-          if (prevMatch.distance == 1 and prevMatch.length > self.MaxSameLetter): # TODO: handle very long self-referencing matches          
-            # just copy predecessor without further (expensive) optimizations
-            matches[i].length = prevMatch.length - 1
-            matches[i].distance = prevMatch.distance
+          # show progress
+          if (progress is not None and (i & 511) == 0):
+            self.reportProgress(self.PhaseMatching, i / blockSize)
+
+          # no matches at the end of the block (or matching disabled by command-line option -0 )
+          if (i + self.BlockEndNoMatch > blockSize or uncompressed):
             continue
+      
+          # detect self-matching
+          if (i > 0 and data[dataBlock + i] == data[dataBlock + i - 1]):
+
+            # predecessor had the same match ?
+            if (matchDistances[i - 1] == 1 and matchLengths[i - 1] > self.MaxSameLetter): # TODO: handle very long self-referencing matches          
+              # just copy predecessor without further (expensive) optimizations
+              matchLengths[i] = matchLengths[i - 1] - 1
+              matchDistances[i] = 1
+              continue
           
-        def getLong(buffer, offset):
-          end = offset + 4
-          buf = buffer[offset:end]
-          four = struct.unpack('>L', buf)[0]
-          return four
-
-        # read next four bytes
-        four = getLong(data, dataBlock + i)
-
-        # convert to a shorter hash
-        hash = ((four * HashMultiplier) >> HashShift) & (HashSize - 1)
+          # hash the whole block at once as soon as the lookback bytes are done
+          if (i == 0 and useNumpy):
+            hashChains, exactChains = self.buildHashChainsNumpy(data, dataZero, lastBlock, blockSize - self.BlockEndNoMatch + 1, lastHash, previousHash)
+
+          if (i >= 0 and hashChains is not None):
+            prevIndex = (i + lastBlock) % self.PreviousSize
+            previousHash[prevIndex] = hashChains[i]
+            previousExact[prevIndex] = exactChains[i]
+
+            # no match at all ?
+            if (exactChains[i] == self.NoPrevious):
+              continue
+
+          else:
+            def getLong(buffer, offset):
+              end = offset + 4
+              buf = buffer[offset:end]
+              four = struct.unpack('>L', buf)[0]
+              return four
+
+            # read next four bytes
+            four = getLong(data, dataBlock + i)
+
+            # convert to a shorter hash
+            hash = ((four * HashMultiplier) >> HashShift) & (HashSize - 1)
         
-        # get last occurrence of these bits
-        last = lastHash[hash]
+            # get last occurrence of these bits
+            last = lastHash[hash]
         
-        # and store current position
-        lastHash[hash] = i + lastBlock
+            # and store current position
+            lastHash[hash] = i + lastBlock
         
-        # remember: i could be negative, too
-        prevIndex = (i + self.PreviousSize) % self.PreviousSize
+            if (useBinaryTree):
+              # insert the current position into the binary tree of its hash bucket, this finds the longest match, too
+              if (metrics is not None):
+                findStart = timer()
+              longest = self.findLongestMatchBinaryTree(data, i + lastBlock, dataZero, nextBlock - self.BlockEndLiterals + 1, numRead, last, treeNodes)
+              if (metrics is not None):
+                findTime += timer() - findStart
+
+              # too close to the end of the data, it stays pending and the tree keeps its root
+              if (i + lastBlock + self.TreeNiceLength > numRead):
+                lastHash[hash] = last
+              if (not longest.isMatch()):
+                continue
+
+            else:
+              # same index as position i + lastBlock gets in findLongestMatch (blocks don't always start at a multiple of PreviousSize)
+              prevIndex = (i + lastBlock) % self.PreviousSize
         
-        # no predecessor or too far away ?
-        distance = i + lastBlock - last
-        if (last == NoLastHash or distance > self.MaxDistance):
-          previousHash[prevIndex] = self.NoPrevious
-          previousExact[prevIndex] = self.NoPrevious
-          continue
+              # no predecessor or too far away ?
+              distance = i + lastBlock - last
+              if (last == NoLastHash or distance > self.MaxDistance):
+                previousHash[prevIndex] = self.NoPrevious
+                previousExact[prevIndex] = self.NoPrevious
+                continue
         
-        # build hash chain, i.e. store distance to last match
-        previousHash[prevIndex] = distance
-
-        # skip pseudo-matches (hash collisions) and build a second chain where the first four bytes must match exactly
-        while (distance != self.NoPrevious):
-          curFour = getLong(data, last - dataZero)  # may be in the previous block, too
-
-          # actual match found, first 4 bytes are identical
-          if (curFour == four):
-            break
-
-          # prevent from accidently hopping on an old, wrong hash chain
-          curHash = ((curFour * HashMultiplier) >> HashShift) & (HashSize - 1)
-          if (curHash != hash):
-            distance = self.NoPrevious
-            break
+              # build hash chain, i.e. store distance to last match
+              previousHash[prevIndex] = distance
+
+              # skip pseudo-matches (hash collisions) and build a second chain where the first four bytes must match exactly
+              while (distance != self.NoPrevious):
+                curFour = getLong(data, last - dataZero)  # may be in the previous block, too
+
+                # actual match found, first 4 bytes are identical
+                if (curFour == four):
+                  break
+
+                # prevent from accidently hopping on an old, wrong hash chain
+                curHash = ((curFour * HashMultiplier) >> HashShift) & (HashSize - 1)
+                if (curHash != hash):
+                  distance = self.NoPrevious
+                  break
           
-          # try next pseudo-match
-          next = previousHash[last % self.PreviousSize]
+                # try next pseudo-match
+                next = previousHash[last % self.PreviousSize]
 
-          # pointing to outdated hash chain entry ?
-          distance += next
+                # pointing to outdated hash chain entry ?
+                distance += next
 
-          if (distance > self.MaxDistance):
-            previousHash[last % self.PreviousSize] = self.NoPrevious
-            distance = self.NoPrevious
-            break
+                if (distance > self.MaxDistance):
+                  previousHash[last % self.PreviousSize] = self.NoPrevious
+                  distance = self.NoPrevious
+                  break
           
-          # closest match is out of range ?
-          last -= next
-          if (next == self.NoPrevious or last < dataZero):
-            distance = self.NoPrevious
-            break
+                # closest match is out of range ?
+                last -= next
+                if (next == self.NoPrevious or last < dataZero):
+                  distance = self.NoPrevious
+                  break
           
         
-        # no match at all ?
-        if (distance == self.NoPrevious):
-          previousExact[prevIndex] = self.NoPrevious
-          continue
+              # no match at all ?
+              if (distance == self.NoPrevious):
+                previousExact[prevIndex] = self.NoPrevious
+                continue
         
-        # store distance to previous match
-        previousExact[prevIndex] = distance
+              # store distance to previous match
+              previousExact[prevIndex] = distance
 
-        # no matching if crossing block boundary, just update hash tables
-        if (i < 0):
-          continue
 
-        # skip match finding if in greedy mode
-        if (skipMatches > 0):
-          skipMatches -= 1
-          if (not lazyEvaluation):
+          # no matching if crossing block boundary, just update hash tables
+          if (i < 0):
             continue
 
-          lazyEvaluation = False
-        
-        # and look for longest match
-        longest = self.findLongestMatch(data, i + lastBlock, dataZero, nextBlock - self.BlockEndLiterals + 1, previousExact)
-        matches[i] = longest
-
-        # no match finding needed for the next few bytes in greedy/lazy mode
-        if (longest.isMatch() and (isLazy or isGreedy)):
-          lazyEvaluation = (skipMatches == 0)
-          skipMatches = longest.length
+          # skip match finding if in greedy mode
+          if (skipMatches > 0):
+            skipMatches -= 1
+            if (not lazyEvaluation):
+              continue
+
+            lazyEvaluation = False
         
+          # and look for longest match
+          if (not useBinaryTree):
+            if (metrics is not None):
+              findStart = timer()
+            longest = self.findLongestMatch(data, i + lastBlock, dataZero, nextBlock - self.BlockEndLiterals + 1, previousExact)
+            if (metrics is not None):
+              findTime += timer() - findStart
+          matchLengths[i] = longest.length
+          matchDistances[i] = longest.distance
+
+          # no match finding needed for the next few bytes in greedy/lazy mode
+          if (longest.isMatch() and (isLazy or isGreedy)):
+            lazyEvaluation = (skipMatches == 0)
+            skipMatches = longest.length
+
+        if (metrics is not None):
+          metrics["findLongestMatchTime"] = findTime
+          metrics["hashChainTime"] = timer() - startTime - findTime
+
+        # the last positions of this block are inserted into the binary trees by the next block
+        treePending = max(treePending, min(numRead - self.TreeNiceLength, nextBlock - self.BlockEndNoMatch) + 1)
       
+
       # dictionary applies only to the first block
       parseDictionary = False
       
       # ==================== estimate costs (number of compressed bytes) ====================
       if LZ4.Verbose:
-        print("")
         print("  Estimating costs...")
 
       # not needed in greedy mode and/or very short blocks
-      if (len(matches) > self.BlockEndNoMatch and self.maxChainLength > self.ShortChainsGreedy):
-        self.estimateCosts(matches)
+      if (blockSize > self.BlockEndNoMatch and self.maxChainLength > self.ShortChainsGreedy):
+        if (metrics is not None):
+          startTime = timer()
+        self.estimateCosts(matchLengths, matchDistances)
+        if (metrics is not None):
+          metrics["estimateCostsTime"] = timer() - startTime
 
       # ==================== select best matches ====================
       if LZ4.Verbose:
-        print("")
         print("  Selecting best matches...")
       
       block = bytearray()
       if (not uncompressed):
-        block = self.selectBestMatches(matches, data, lastBlock - dataZero )
+        if (metrics is not None):
+          startTime = timer()
+        block = self.selectBestMatches(matchLengths, matchDistances, data, lastBlock - dataZero )
+        if (metrics is not None):
+          metrics["selectBestMatchesTime"] = timer() - startTime
       
       # ==================== output ====================
+      outputData = bytearray()
+
       # automatically decide whether compressed or uncompressed
       uncompressedSize = nextBlock - lastBlock
 
@@ -840,6 +1776,27 @@ class LZ4():
         index = lastBlock - dataZero
         sendBytes( data[index:index + numBytes] )
 
+      # block checksum: xxHash32 of the block data as stored (behind its 4 byte size)
+      if (self.blockChecksumEnabled):
+        sendBytes( XXHash32(memoryview(outputData)[4:]).digest() )
+
+      # content checksum of the frame, written by endFrame()
+      if (self.contentHash is not None):
+        index = lastBlock - dataZero
+        self.contentHash.update( memoryview(data)[index:index + uncompressedSize] )
+
+      if (metrics is not None):
+        metrics["bytesOut"] = len(outputData)
+        if (self.traceMemory and tracemalloc.is_tracing()):
+          metrics["peakMemory"] = tracemalloc.get_traced_memory()[1]
+        self.stats.setdefault("blocks", []).append(metrics)
+
+      if (self.progressCallback is not None):
+        self.reportProgress(self.PhaseBlock, 1.0, True)
+      self.blockIndex += 1
+
+      yield outputData
+
       # disable matching across blocks if True (was a legacy format code path)
       if (False):
         dataZero += len(data)
@@ -859,14 +1816,14 @@ class LZ4():
         if (len(data) > self.MaxDistance):
           remove = len(data) - self.MaxDistance
           dataZero += remove
-          data = data[remove:]
-
-    return outputData
+          del data[:remove]
     
   #-------------------------------------------------------------------------------------------------
   # Emit an LZ4 compatible frame header to the outputBuffer bytearray  
   #-------------------------------------------------------------------------------------------------
-  def beginFrame(self, outputBuffer):
+  # contentSize is the size of the uncompressed data, stored in the header if it's not None
+  #-------------------------------------------------------------------------------------------------
+  def beginFrame(self, outputBuffer, contentSize = None):
 
     # ==================== write LZ4 header ====================
     # magic bytes
@@ -875,15 +1832,41 @@ class LZ4():
     # flags
     # (7-6) FieldName	Version (5)	B.Indep (4)	B.Checksum (3)	C.Size (2)	C.Checksum (1) Reserved (0)	DictID
     flags = 1 << 6 # Version, dependent blocks, no block checksum, no size, no content checksum, no dict ID 
-    outputBuffer.append( struct.pack('B', flags) )
+    if self.dictID is not None:
+      flags |= 1
+    if self.blockIndependence:
+      flags |= 1 << 5
+    if self.blockChecksumEnabled:
+      flags |= 1 << 4
+    if contentSize is not None:
+      flags |= 1 << 3
+    if self.contentChecksumEnabled:
+      flags |= 1 << 2
+    descriptor = bytearray([flags])
 
     # max blocksize
     maxBlockSizeId = self.MaxBlockSizeId << 4
-    outputBuffer.append( struct.pack('B', maxBlockSizeId) )
+    descriptor.append( maxBlockSizeId )
+
+    # optional content size
+    if contentSize is not None:
+      descriptor.extend( struct.pack('<Q', contentSize) )
+
+    # optional dictionary ID
+    if self.dictID is not None:
+      descriptor.extend( struct.pack('<I', self.dictID) )
     
-    # header checksum (precomputed)
-    checksum = 0xDF
-    outputBuffer.append( struct.pack('B', checksum) )
+    # header checksum: second byte of the descriptor's xxHash32
+    checksum = (xxhash32(descriptor) >> 8) & 0xFF
+    outputBuffer.extend( descriptor )
+    outputBuffer.append( checksum )
+
+    self.blockIndex = 0
+
+    # all uncompressed data of the frame is hashed as it's compressed
+    self.contentHash = None
+    if self.contentChecksumEnabled:
+      self.contentHash = XXHash32()
 
     # reset stats for each frame
     # (can be manually called per-block also if desired)
@@ -898,13 +1881,20 @@ class LZ4():
     # add an empty block
     outputBuffer.extend(struct.pack('i', 0))    
 
+    # followed by the content checksum
+    if self.contentHash is not None:
+      outputBuffer.extend(self.contentHash.digest())
+      self.contentHash = None
+
   #-------------------------------------------------------------------------------------------------
   # setCompression
   # Set the encoder match parameter for compression ratio/speed tradeoff
   # compressionLevel can be 0 (uncompressed), or 1 (low compression, high encoding speed) to 9 (optimal compression, low encoding speed) 
+  # matchFinder selects the engine used to find matches, see MatchFinders
   #-------------------------------------------------------------------------------------------------
-  def setCompression(self, compressionLevel, windowSize = 65535):
+  def setCompression(self, compressionLevel, windowSize = 65535, matchFinder = MatchFinderHashChain):
     assert windowSize < 65536
+    assert matchFinder in self.MatchFinders
     if (compressionLevel >= 9):
       newMaxChainLength = 65536  # "unlimited" because search window contains only 2^16 bytes 
     else:
@@ -917,6 +1907,9 @@ class LZ4():
     # set the sliding window size, 65535 is the default since that is the maximum supported by the 16-bit offset format (ignoring 0, which is an invalid value)
     self.MaxDistance = windowSize
 
+    # the suffix array only applies to optimal parsing, other levels use the hash chains instead
+    self.matchFinder = matchFinder
+
   #-------------------------------------------------------------------------------------------------
   # enable a byte optimized compression mode
   # LZ4 offsets will be output as 8-bits rather than 16-bits, and windowSize will be set to 255
@@ -939,20 +1932,512 @@ class LZ4():
   def getWindowSize(self):
     return self.MaxDistance
 
+  def getMatchFinder(self):
+    return self.matchFinder
+
+  #-------------------------------------------------------------------------------------------------
+  # set the maximum block size by its LZ4 block size ID: 4 = 64Kb, 5 = 256Kb, 6 = 1Mb, 7 = 4Mb (default)
+  # smaller blocks need less memory in the encoder and the decoder, but compress a little worse
+  #-------------------------------------------------------------------------------------------------
+  def setBlockSize(self, blockSizeId):
+    assert blockSizeId >= 4 and blockSizeId <= 7
+    self.MaxBlockSizeId = blockSizeId
+    self.MaxBlockSize   = self.BlockSizes[blockSizeId]
+
+  def getBlockSize(self):
+    return self.MaxBlockSize
+
+  #-------------------------------------------------------------------------------------------------
+  # store the size of the uncompressed data in the frame header (compress() only, it's unknown for streams)
+  # so decoders can preallocate their output
+  #-------------------------------------------------------------------------------------------------
+  def storeContentSize(self, enable = True):
+    self.contentSizeEnabled = enable
+
+  #-------------------------------------------------------------------------------------------------
+  # add xxHash32 checksums to the frame: one per block (of the data as stored) and/or one of the whole uncompressed content
+  # block checksums can be checked without decoding, see LZ4Decoder.verifyBlocks()
+  #-------------------------------------------------------------------------------------------------
+  def setChecksums(self, blockChecksum = False, contentChecksum = False):
+    self.blockChecksumEnabled = blockChecksum
+    self.contentChecksumEnabled = contentChecksum
+
+  #-------------------------------------------------------------------------------------------------
+  # report the progress of the compression to callback(phase, blockIndex, fraction)
+  # phase is one of PhaseMatching, PhaseCosts or PhaseBlock, fraction goes from 0.0 to 1.0 per phase and block
+  # calls are limited to one per interval (in seconds), except for PhaseBlock
+  # no callback (None, the default) means no progress reports at all
+  #-------------------------------------------------------------------------------------------------
+  def setProgress(self, callback = None, interval = 0.25):
+    self.progressCallback = callback
+    self.progressInterval = interval
+    self.nextProgress = 0
+
+  # call the progress callback if the last report is at least progressInterval seconds ago (or if forced)
+  def reportProgress(self, phase, fraction, force = False):
+    now = timer()
+    if (force or now >= self.nextProgress):
+      self.nextProgress = now + self.progressInterval
+      self.progressCallback(phase, self.blockIndex, fraction)
+
+  #-------------------------------------------------------------------------------------------------
+  # select what is recorded in LZ4.stats: StatsNone, StatsCounters (default) or StatsStreams
+  # the streams (tokens, offsets, lengths, literal and length bytes) cost time and memory, only collect them if needed
+  #-------------------------------------------------------------------------------------------------
+  def setStats(self, level):
+    assert level in (self.StatsNone, self.StatsCounters, self.StatsStreams)
+    self.statsLevel = level
+    self.resetStats()
+
+  #-------------------------------------------------------------------------------------------------
+  # record metrics of each block in stats["blocks"]: bytes in/out and the time (in seconds) of each phase
+  # (see MetricsTimes), the suffix array match finder counts entirely as findLongestMatch
+  # traceMemory also records the peak memory allocated by Python during each block (tracemalloc is started
+  # for each frame if needed and stopped at its end, it slows down the compression a lot, so the times
+  # aren't representative anymore, changing it takes effect with the next frame)
+  #-------------------------------------------------------------------------------------------------
+  def setMetrics(self, enable = True, traceMemory = False):
+    self.collectMetrics = enable
+    self.traceMemory = enable and traceMemory
+
+  #-------------------------------------------------------------------------------------------------
+  # the metrics of all blocks of the current frame (stats["blocks"]) and their totals
+  #-------------------------------------------------------------------------------------------------
+  def getMetrics(self):
+    blocks = self.stats.get("blocks", [])
+    metrics = {}
+    for name in ["bytesIn", "bytesOut"] + self.MetricsTimes:
+      metrics[name] = sum(block[name] for block in blocks)
+    peaks = [block["peakMemory"] for block in blocks if block["peakMemory"] is not None]
+    metrics["peakMemory"] = max(peaks) if len(peaks) > 0 else None
+    metrics["blocks"] = blocks
+    return metrics
+
+  #-------------------------------------------------------------------------------------------------
+  # enable independent blocks: no block refers to data of its predecessors (the B.Indep frame flag is set)
+  # that costs a little compression ratio, but blocks can be compressed in parallel
+  # workers is the number of processes compressing blocks at the same time, None means one per CPU
+  #-------------------------------------------------------------------------------------------------
+  def independentBlocks(self, enable = True, workers = 1):
+    self.blockIndependence = enable
+    self.workers = workers
+
+  #-------------------------------------------------------------------------------------------------
+  # enable verification: compress() decodes its own output again and raises a ValueError if it doesn't
+  # match the input, so no broken stream can leave the encoder (needs lz4dec.py)
+  #-------------------------------------------------------------------------------------------------
+  def verifyCompression(self, enable = True):
+    self.verifyOutput = enable
+
+  #-------------------------------------------------------------------------------------------------
+  # register a dictionary for repeated use, its hash chains are built only once (per window size and HashBits)
+  # and copied into each compression instead of hashing all of the dictionary again
+  # dictID is stored in the frame header, default: xxHash32 of the dictionary
+  # returns the dictionary ID, see setDictionary()
+  #-------------------------------------------------------------------------------------------------
+  def registerDictionary(self, dictionary, dictID = None):
+    if (dictID is None):
+      dictID = xxhash32(dictionary)
+    assert 0 <= dictID <= 0xFFFFFFFF
+    self.unregisterDictionary(dictID)
+    self.dictionaries[dictID] = LZ4Dictionary(dictionary, dictID)
+    return dictID
+
+  # remove a registered dictionary (and release its shared memory)
+  def unregisterDictionary(self, dictID):
+    if (dictID == self.dictID):
+      self.setDictionary(None)
+    dictionary = self.dictionaries.pop(dictID, None)
+    if (dictionary is not None):
+      dictionary.close()
+
+  #-------------------------------------------------------------------------------------------------
+  # select the registered dictionary used by the following compressions (None: no dictionary)
+  # its ID is written to the frame header, decoders need the same dictionary
+  # no other dictionary may be passed to compress(), compressBlock() or compressobj() then
+  #-------------------------------------------------------------------------------------------------
+  def setDictionary(self, dictID = None):
+    assert dictID is None or dictID in self.dictionaries, "dictionary " + str(dictID) + " isn't registered"
+    self.dictID = dictID
+
+  #-------------------------------------------------------------------------------------------------
+  # decode a complete LZ4 stream and compare it with the original input data
+  # raises a ValueError if they differ
+  #-------------------------------------------------------------------------------------------------
+  def verify(self, outputData, inputData, dictionary = bytearray()):
+    # imported here, so lz4enc.py still works on its own if verification isn't used
+    from lz4dec import LZ4Decoder
+
+    decoded = LZ4Decoder(self.DistanceByteSize).decompress(outputData, dictionary)
+    if (decoded != memoryview(inputData).cast('B')):
+      raise ValueError("LZ4 verification failed, the compressed stream doesn't decode to the input data")
+
+  #-------------------------------------------------------------------------------------------------
+  # compress each block of the input buffer on its own, blocks are split across worker processes if enabled
+  # improve compression with a predefined dictionary (each block may refer to it)
+  # returns a bytearray with all compressed blocks in their original order
+  #-------------------------------------------------------------------------------------------------
+  def compressIndependentBlocks(self, inputData, dictionary = bytearray()):
+    inputData = memoryview(inputData).cast('B')
+    blocks = [ inputData[offset:offset + self.MaxBlockSize] for offset in range(0, len(inputData), self.MaxBlockSize) ]
+
+    workers = self.workers
+    if workers is None:
+      workers = os.cpu_count() or 1
+
+    outputData = bytearray()
+    if (workers <= 1 or len(blocks) <= 1):
+      # the hash tables are reused, but their previous contents are never visible to a new input
+      for block in blocks:
+        outputData.extend(self.compressBlock(block, dictionary))
+      return outputData
+
+    # the workers don't know the frame's content hash
+    if (self.contentHash is not None):
+      self.contentHash.update(inputData)
+
+    # the workers receive the hash chains of a registered dictionary (in shared memory, see LZ4Dictionary)
+    if (self.dictID is not None):
+      self.dictionaries[self.dictID].prime(self)
+      self.dictionaries[self.dictID].share()
+
+    # views can't be pickled, each block is copied when it's sent to its worker
+    count = len(blocks)
+    blocks = ( bytes(block) for block in blocks )
+    with concurrent.futures.ProcessPoolExecutor(max_workers = min(workers, count)) as executor:
+      results = executor.map(compressIndependentBlock, [self] * count, blocks, [bytes(dictionary)] * count)
+      for block, stats in results:
+        outputData.extend(block)
+        self.mergeStats(stats)
+
+        # the workers don't report their progress, only finished blocks are reported
+        if (self.progressCallback is not None):
+          self.reportProgress(self.PhaseBlock, 1.0, True)
+        self.blockIndex += 1
+
+    return outputData
+
+  #-------------------------------------------------------------------------------------------------
+  # add the stats of a block compressed by another LZ4 instance (see compressIndependentBlocks)
+  #-------------------------------------------------------------------------------------------------
+  def mergeStats(self, stats):
+    for name in ["tokens", "offsets", "lengths", "literal_bytes", "lengths_bytes", "blocks"]:
+      if name in self.stats:
+        self.stats[name].extend(stats[name])
+    if (self.statsLevel < self.StatsCounters):
+      return
+
+    for name in ["tokenCount", "byteOffsetCount", "sameOffsetCount"]:
+      self.stats[name] += stats[name]
+    for name in ["largestOffset", "largestLength"]:
+      self.stats[name] = max(self.stats[name], stats[name])
+
+    # the other instance didn't know the last match distance of the previous block
+    if stats["lastOffset"] != -1:
+      if stats["firstOffset"] == self.stats["lastOffset"]:
+        self.stats["sameOffsetCount"] += 1
+      if self.stats["firstOffset"] == -1:
+        self.stats["firstOffset"] = stats["firstOffset"]
+      self.stats["lastOffset"] = stats["lastOffset"]
+
+  #-------------------------------------------------------------------------------------------------
+  # pickle support (needed by worker processes)
+  # hash tables and stats are not copied, class-level settings are because they might have been changed
+  #-------------------------------------------------------------------------------------------------
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state["lastHash"] = None
+    state["treeNodes"] = None
+    state["nextPosition"] = 0
+    state["stats"] = {}
+    state["contentHash"] = None
+    state["progressCallback"] = None
+    for name in self.PickledClassSettings:
+      state[name] = getattr(self, name)
+    return state
+
   #--------------------------------------------------------------------------------------------------------------------------------
   # compress everything in input stream (accessed via getByte) and write to complete LZ4 output stream
   # improve compression with a predefined dictionary
   #--------------------------------------------------------------------------------------------------------------------------------
-  # inputData, and dictionary are bytearray's
+  # inputData, and dictionary are bytearray's (or any other buffer: bytes, memoryview, mmap, NumPy arrays)
   # returns a bytearray containing the compressed LZ4 stream
   def compress(self, inputData, dictionary = bytearray()):
     outputBuffer = bytearray()
-    self.beginFrame(outputBuffer)
+    contentSize = None
+    if (self.contentSizeEnabled):
+      contentSize = memoryview(inputData).nbytes
+    self.beginFrame(outputBuffer, contentSize)
     compressedBlock = self.compressBlock(inputData, dictionary)
     outputBuffer.extend(compressedBlock)
     self.endFrame(outputBuffer)
+
+    if (self.verifyOutput):
+      if (self.dictID is not None):
+        dictionary = self.dictionaries[self.dictID].data
+      self.verify(outputBuffer, inputData, dictionary)
     return outputBuffer
 
+  #--------------------------------------------------------------------------------------------------------------------------------
+  # create a streaming compressor with the same settings (similar to zlib.compressobj), see LZ4Stream
+  # improve compression with a predefined dictionary
+  # contentSize is stored in the frame header if it's not None, it must match the total size of the input
+  #--------------------------------------------------------------------------------------------------------------------------------
+  def compressobj(self, dictionary = bytearray(), contentSize = None):
+    return LZ4Stream(self, dictionary, contentSize)
+
+
+#-------------------------------------------------------------------------------------------------
+# streaming compressor, produces the same LZ4 frames as LZ4.compress() without having all input at once
+# input can be fed in chunks of any size, each block is compressed as soon as a full block (MaxBlockSize) is
+# available, so only the sliding window (64k) and the pending block are kept in memory
+#-------------------------------------------------------------------------------------------------
+class LZ4Stream():
+
+  def __init__(self, compressor, dictionary = bytearray(), contentSize = None):
+    # a private copy of the compressor's settings, its hash tables aren't shared with other streams
+    self.compressor = copy.copy(compressor)
+    self.compressor.setProgress(compressor.progressCallback, compressor.progressInterval)
+    self.dictionary = dictionary
+    # fed, but not read by the compressor yet
+    self.pending = bytearray()
+    self.finished = False
+    self.flushing = False
+    # generator of compressed blocks (dependent blocks only), see LZ4.compressBlocks()
+    self.blocks = None
+
+    # the frame header is returned along with the first output
+    self.output = bytearray()
+    self.compressor.beginFrame(self.output, contentSize)
+
+  #-------------------------------------------------------------------------------------------------
+  # compress the next chunk of input, data can be any buffer (bytes, bytearray, memoryview, mmap, NumPy arrays)
+  # returns a bytearray with all output that is ready so far (often empty)
+  #-------------------------------------------------------------------------------------------------
+  def feed(self, data):
+    assert not self.finished
+    self.pending.extend(memoryview(data).cast('B'))
+    return self.run(False)
+
+  #-------------------------------------------------------------------------------------------------
+  # compress all input fed so far, even if that's less than a full block (costs some compression ratio)
+  # returns a bytearray with all output that is ready so far
+  #-------------------------------------------------------------------------------------------------
+  def flush(self):
+    return self.run(True)
+
+  #-------------------------------------------------------------------------------------------------
+  # compress the remaining input and end the frame, no more input afterwards
+  # returns a bytearray with the rest of the output
+  #-------------------------------------------------------------------------------------------------
+  def finish(self):
+    self.finished = True
+    output = self.run(True)
+    self.compressor.endFrame(output)
+    return output
+
+  #-------------------------------------------------------------------------------------------------
+  # stats of all blocks so far (see LZ4.resetStats)
+  #-------------------------------------------------------------------------------------------------
+  def getStats(self):
+    return self.compressor.stats
+
+  # read count bytes of pending input, an empty buffer at the end of the stream, None if there is not enough input yet
+  # (less than count bytes only when flushing or finishing, so blocks are cut exactly like LZ4.compress() does)
+  def getBytes(self, count):
+    if (len(self.pending) == 0):
+      if (self.finished):
+        return bytearray()
+      return None
+    if (len(self.pending) < count and not self.finished and not self.flushing):
+      return None
+
+    buffer = self.pending[:count]
+    del self.pending[:count]
+    return buffer
+
+  # compress as many blocks as possible, flush compresses a shorter block if some input is left
+  def run(self, flush):
+    output = self.output
+    self.output = bytearray()
+
+    # independent blocks don't need any history, simply compress each block on its own
+    if (self.compressor.blockIndependence):
+      available = len(self.pending)
+      if (not flush):
+        available -= available % self.compressor.MaxBlockSize
+      if (available > 0):
+        output.extend(self.compressor.compressBlock(self.pending[:available], self.dictionary))
+        del self.pending[:available]
+      return output
+
+    # run the block loop until it waits for more input
+    self.flushing = flush
+    try:
+      if (self.blocks is None):
+        self.blocks = self.compressor.compressBlocks(self.getBytes, None, self.dictionary)
+        block = next(self.blocks)
+      else:
+        block = self.blocks.send(False)
+
+      while (True):
+        while (block is not None):
+          output.extend(block)
+          block = next(self.blocks)
+
+        # all input is read, the block loop compresses a partial block if it was told to flush
+        if (not flush):
+          break
+        flush = False
+        block = self.blocks.send(True)
+    except StopIteration:
+      pass
+    self.flushing = False
+
+    return output
+
+
+#-------------------------------------------------------------------------------------------------
+# a dictionary registered with LZ4.registerDictionary()
+# the hash chains of the dictionary are built once per compressor setting and copied into each compression
+# that uses it (only the last UnprimedBytes are hashed again, their four bytes reach into the block)
+# pickled copies (worker processes) get the hash chains through shared memory instead of building them again
+#-------------------------------------------------------------------------------------------------
+class LZ4Dictionary():
+
+  # the last bytes of the dictionary, which are hashed along with the block
+  UnprimedBytes = 3
+
+  def __init__(self, dictionary, dictID):
+    self.dictID = dictID
+    # only the most recent 64k can be referenced
+    self.data = bytes(memoryview(dictionary).cast('B')[-LZ4.MaxDictionary:]) if len(dictionary) > 0 else bytes()
+    # hash chains per setting (see prime), shared memory blocks created by this instance and the ones that can be attached to
+    self.primed = {}
+    self.shared = {}
+    self.sharedLayouts = {}
+
+  #-------------------------------------------------------------------------------------------------
+  # hash chains for the compressor's settings, built on first use
+  # returns (hashes, positions, previousHash, previousExact), positions are relative to the dictionary prefix
+  #-------------------------------------------------------------------------------------------------
+  def prime(self, compressor):
+    NoLastHash = 0x7FFFFFFF
+    key = (compressor.HashBits, compressor.MaxDistance)
+    if (key in self.primed):
+      return self.primed[key]
+
+    if (key in self.sharedLayouts):
+      self.primed[key] = self.attach(self.sharedLayouts[key])
+      return self.primed[key]
+
+    # hash the dictionary exactly like compressBlocks() does, at the start of empty tables:
+    # the dictionary is prepended as 64k (padded at the front), the block starts at position MaxDictionary
+    prefix = bytes(LZ4.MaxDictionary - len(self.data)) + self.data
+    lastHash = array.array('i', [NoLastHash]) * (1 << compressor.HashBits)
+    previousHash = array.array('H', bytes(2 * LZ4.PreviousSize))
+    previousExact = array.array('H', bytes(2 * LZ4.PreviousSize))
+    count = max(0, len(self.data) - self.UnprimedBytes)
+    compressor.buildHashChains(prefix, 0, LZ4.MaxDictionary - len(self.data), count, lastHash, previousHash, previousExact)
+
+    # keep only the hashes which were used
+    hashes = array.array('i', [hash for hash, position in enumerate(lastHash) if position != NoLastHash])
+    positions = array.array('i', [lastHash[hash] for hash in hashes])
+
+    self.primed[key] = (hashes, positions, previousHash, previousExact)
+    return self.primed[key]
+
+  #-------------------------------------------------------------------------------------------------
+  # copy the hash chains into a compressor's tables, base is the file position of the dictionary prefix
+  # (a multiple of PreviousSize, see LZ4.reuseHashTables)
+  #-------------------------------------------------------------------------------------------------
+  def apply(self, compressor, base, lastHash, previousHash, previousExact):
+    hashes, positions, primedHash, primedExact = self.prime(compressor)
+    previousHash[:] = primedHash
+    previousExact[:] = primedExact
+    if (numpy is not None and compressor.UseNumpy):
+      table = numpy.frombuffer(lastHash, dtype=lastHash.typecode)
+      table[numpy.frombuffer(hashes, dtype=numpy.int32)] = numpy.frombuffer(positions, dtype=numpy.int32).astype(numpy.int64) + base
+    else:
+      for hash, position in zip(hashes, positions):
+        lastHash[hash] = position + base
+
+  #-------------------------------------------------------------------------------------------------
+  # shared memory
+  #-------------------------------------------------------------------------------------------------
+  # copy the hash chains of one setting out of a shared memory block, layout is (name, number of hashes)
+  def attach(self, layout):
+    name, count = layout
+    block = shared_memory.SharedMemory(name = name)
+    try:
+      parts = []
+      offset = 0
+      for typecode, length in [('i', count), ('i', count), ('H', LZ4.PreviousSize), ('H', LZ4.PreviousSize)]:
+        part = array.array(typecode)
+        size = length * part.itemsize
+        part.frombytes(block.buf[offset:offset + size])
+        parts.append(part)
+        offset += size
+    finally:
+      block.close()
+    return tuple(parts)
+
+  # put the hash chains into shared memory (once), before worker processes are started
+  # (so they use the same resource tracker, which would remove the shared memory when a worker ends otherwise)
+  def share(self):
+    if (shared_memory is None):
+      return
+    for key, chains in self.primed.items():
+      if (key not in self.shared):
+        content = b''.join([part.tobytes() for part in chains])
+        block = shared_memory.SharedMemory(create = True, size = len(content))
+        block.buf[:len(content)] = content
+        self.shared[key] = block
+        self.sharedLayouts[key] = (block.name, len(chains[0]))
+
+  # pickle support (needed by worker processes): only the names of the shared memory blocks are pickled
+  # (the hash chains themselves without shared memory)
+  def __getstate__(self):
+    self.share()
+    state = { "dictID" : self.dictID, "data" : self.data, "primed" : {}, "shared" : {}, "sharedLayouts" : dict(self.sharedLayouts) }
+    if (shared_memory is None):
+      state["primed"] = dict(self.primed)
+    return state
+
+  # release the shared memory created by this instance
+  def close(self):
+    for block in self.shared.values():
+      block.close()
+      block.unlink()
+    self.shared = {}
+    self.sharedLayouts = {}
+
+  def __del__(self):
+    self.close()
+
+
+#-------------------------------------------------------------------------------------------------
+# compress a single block of an independent blocks frame, runs in a worker process
+# compressor is a pickled copy of the LZ4 instance (without progress callback), its verbose output is discarded
+# returns the compressed block and its stats
+#-------------------------------------------------------------------------------------------------
+def compressIndependentBlock(compressor, inputData, dictionary):
+  compressor.resetStats()
+  with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    block = compressor.compressBlock(inputData, dictionary)
+  return block, compressor.stats
+
+
+#-------------------------------------------------------------------------------------------------
+# progress callback of the command line tool (verbose mode only)
+#-------------------------------------------------------------------------------------------------
+def showProgress(phase, blockIndex, fraction):
+  if phase == LZ4.PhaseBlock:
+    print("   Block " + str(blockIndex) + " done." + " " * 20)
+  else:
+    sys.stdout.write("   Block " + str(blockIndex) + ", " + phase + " " + str(int(fraction * 100)) + "%...\r")
+    sys.stdout.flush()
+
 
 #-------------------------
 # main()
@@ -974,22 +2459,60 @@ def main(args):
   if not os.path.isfile(src):
     print("ERROR: File '" + src + "' not found")
     sys.exit()
+  if args.dict and not os.path.isfile(args.dict):
+    print("ERROR: Dictionary '" + args.dict + "' not found")
+    sys.exit()
 
-  # create the instance
+  # create the instance (the command line tool doesn't use any stats)
   compressor = LZ4()
+  compressor.setStats(LZ4.StatsNone)
 
   # set the compression parameters
-  compressor.setCompression(args.compress, args.window)
-
-  # load the input file into memory
+  compressor.setCompression(args.compress, args.window, args.matchfinder)
+  compressor.setBlockSize(args.blocksize)
+  compressor.storeContentSize(args.content_size)
+  compressor.setChecksums(args.block_checksum, args.content_checksum)
+  if args.optimized:
+    compressor.optimizedCompression(True)
+  if args.independent or args.jobs != 1:
+    workers = args.jobs
+    if workers == 0:
+      workers = None
+    compressor.independentBlocks(True, workers)
+
+  # the dictionary is registered, so its ID is stored in the frame header
+  if args.dict:
+    with open(args.dict, 'rb') as fh:
+      dictID = compressor.registerDictionary(fh.read(), args.dict_id)
+    compressor.setDictionary(dictID)
+    if LZ4.Verbose:
+      print("Using dictionary '" + args.dict + "', ID " + str(dictID))
+
+  # map the input file into memory (empty files can't be mapped)
   fh = open(src, 'rb')
-  file_in = bytearray(fh.read())
-  fh.close()
+  if os.path.getsize(src) > 0:
+    file_in = mmap.mmap(fh.fileno(), 0, access = mmap.ACCESS_READ)
+  else:
+    file_in = bytearray()
+
+  # decode the output again before it's written
+  compressor.verifyCompression(args.verify)
+
+  # show the progress of each block in verbose mode
+  if LZ4.Verbose:
+    compressor.setProgress(showProgress)
+
+  # time (and memory) of each block
+  if args.metrics:
+    compressor.setMetrics(True, args.trace_memory)
 
   # compress into LZ4 file stream
   if LZ4.Verbose:
     print("Compressing file '" + src + "' to '" + dst + "', using compression level " + str(args.compress) )
   file_out = compressor.compress(file_in, bytearray())
+  if isinstance(file_in, mmap.mmap):
+    file_in.close()
+  fh.close()
 
   # write the LZ4 stream to output file
   fh = open(dst, 'wb')
@@ -1012,6 +2535,13 @@ def main(args):
     t = '{:.2f}'.format(end_time-start_time)
     print("Completed in " + t + "s.")
 
+  # write the metrics as JSON
+  if args.metrics:
+    metrics = { "input" : src, "compressionLevel" : args.compress, "matchFinder" : args.matchfinder, "totalTime" : end_time - start_time }
+    metrics.update(compressor.getMetrics())
+    with open(args.metrics, 'w') as fh:
+      json.dump(metrics, fh, indent = 2)
+
 #--------------------------------
 
 # Determine if running as a script
@@ -1035,15 +2565,28 @@ if __name__ == '__main__':
   parser.add_argument("input", help="read from file [input]")
   parser.add_argument("-o", "--output", help="write to file [output] (default is '[input].lz4'")
   parser.add_argument("-D", "--dict", metavar="file", help="Load dictionary file")
+  parser.add_argument("--dict-id", type=int, metavar="int", help="Dictionary ID stored in the frame header, default: xxHash32 of the dictionary")
   parser.add_argument("-c", "--compress", type=int, default=9, metavar="int", help="Set compression level (0-9), default: 9")
   parser.add_argument("-f", "--force", help="Overwrite an existing file", action="store_true")
-  parser.add_argument("-p", "--profile", help="Profile the script", action="store_true")
+  parser.add_argument("-p", "--profile", help="Profile the script with cProfile", action="store_true")
+  parser.add_argument("--profile-output", metavar="file", help="Write the cProfile stats to this file (load it with pstats), implies -p")
+  parser.add_argument("--metrics", metavar="file", help="Write the time of each compression phase per block to this JSON file")
+  parser.add_argument("--trace-memory", help="Add the peak traced memory of each block to the metrics (slow)", action="store_true")
   parser.add_argument("-w", "--window", type=int, default=LZ4.MaxDistance, help="Set LZ4 window size, default:"+str(LZ4.MaxDistance))
+  parser.add_argument("-m", "--matchfinder", default=LZ4.MatchFinderHashChain, choices=LZ4.MatchFinders, help="Set match finder engine, default:"+LZ4.MatchFinderHashChain)
+  parser.add_argument("-i", "--independent", help="Compress blocks independently", action="store_true")
+  parser.add_argument("-j", "--jobs", type=int, default=1, metavar="int", help="Compress independent blocks with this many processes (0 means one per CPU), default: 1")
+  parser.add_argument("-B", "--blocksize", type=int, default=LZ4.MaxBlockSizeId, choices=[4, 5, 6, 7], help="Set block size ID: 4 = 64Kb, 5 = 256Kb, 6 = 1Mb, 7 = 4Mb, default: " + str(LZ4.MaxBlockSizeId))
+  parser.add_argument("--content-size", help="Store the uncompressed size in the frame header", action="store_true")
+  parser.add_argument("--block-checksum", help="Add an xxHash32 checksum to each block", action="store_true")
+  parser.add_argument("--content-checksum", help="Add an xxHash32 checksum of the uncompressed data to the frame", action="store_true")
+  parser.add_argument("-O", "--optimized", help="Store match offsets in 8 bits, window size 255 (not LZ4 compatible)", action="store_true")
+  parser.add_argument("--verify", help="Decompress the output and compare it with the input before writing it", action="store_true")
   parser.add_argument("-v", "--verbose", help="Enable verbose mode", action="store_true")
   args = parser.parse_args()
 
-  if args.profile:
-    profile.run('main(args)')
+  if args.profile or args.profile_output:
+    cProfile.run('main(args)', args.profile_output, sort = 'cumulative')
   else:
     main(args)
 
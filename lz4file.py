@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# lz4file.py
+# File-like access to LZ4 frames (similar to gzip.GzipFile), based on lz4enc.py and lz4dec.py
+# By Simon Morris (https://github.com/simondotm/)
+# See https://github.com/simondotm/lz4enc-python
+#
+# Copyright (c) 2019 Simon Morris. All rights reserved.
+#
+# "MIT License":
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import io
+import struct
+import collections
+import concurrent.futures
+
+from lz4enc import LZ4
+from lz4dec import LZ4Decoder
+from xxhash32 import xxhash32, XXHash32
+
+
+#-------------------------------------------------------------------------------------------------
+# raw reader of LZ4 frames, decodes one block at a time
+# only the current block and the 64k history of dependent blocks are kept in memory
+#-------------------------------------------------------------------------------------------------
+class LZ4Reader(io.RawIOBase):
+
+  def __init__(self, fileobj, dictionary = bytearray()):
+    self.fileobj = fileobj
+    self.decoder = LZ4Decoder()
+    # only the most recent 64k of the dictionary can be referenced
+    self.prefix = bytearray(memoryview(dictionary)[-LZ4Decoder.MaxDictionary:]) if len(dictionary) > 0 else bytearray()
+    # settings of the current frame, None between frames
+    self.frame = None
+    # history followed by the current decoded block, history[position:] hasn't been read yet
+    self.history = bytearray()
+    self.position = 0
+    # hash of the frame's decoded data (if it has a content checksum)
+    self.contentHash = None
+
+  def readable(self):
+    return True
+
+  # read up to count bytes of the compressed stream, fewer only at its end
+  # (raw files, pipes and sockets may return less than requested before that)
+  def readAvailable(self, count):
+    data = self.fileobj.read(count)
+    if (len(data) == count or len(data) == 0):
+      return data
+    data = bytearray(data)
+    while (len(data) < count):
+      more = self.fileobj.read(count - len(data))
+      if (not more):
+        break
+      data += more
+    return data
+
+  # read exactly count bytes of the compressed stream
+  def readBytes(self, count):
+    data = self.readAvailable(count)
+    if (len(data) != count):
+      raise ValueError("LZ4 stream is truncated")
+    return data
+
+  # read the next frame header, returns False at the end of the stream
+  def nextFrame(self):
+    while (True):
+      header = self.readAvailable(4)
+      if (len(header) == 0):
+        return False
+      if (len(header) != 4):
+        raise ValueError("LZ4 stream is truncated")
+
+      # skippable frames contain user data, just jump over them
+      magic = struct.unpack('<I', header)[0]
+      if ((magic & 0xFFFFFFF0) != LZ4Decoder.SkippableMagic):
+        break
+      size = struct.unpack('<I', self.readBytes(4))[0]
+      self.readBytes(size)
+
+    # flags, block size and header checksum, plus the optional content size and dictionary ID
+    header += self.readBytes(3)
+    flags = header[4]
+    header += self.readBytes((8 if flags & 0x08 else 0) + (4 if flags & 0x01 else 0))
+    self.frame, _ = self.decoder.readFrameHeader(header)
+
+    self.history = bytearray(self.prefix)
+    self.position = len(self.history)
+    self.contentHash = XXHash32() if self.frame["contentChecksum"] else None
+    return True
+
+  # decode the next block of the current frame, returns False at the end of the frame
+  def nextBlock(self):
+    frame = self.frame
+
+    # keep only the window for the next block
+    if (frame["blockIndependence"]):
+      self.history = bytearray(self.prefix)
+    elif (len(self.history) > LZ4Decoder.MaxDictionary):
+      del self.history[:len(self.history) - LZ4Decoder.MaxDictionary]
+    self.position = len(self.history)
+
+    blockSize = struct.unpack('<I', self.readBytes(4))[0]
+
+    # end mark, followed by the content checksum
+    if (blockSize == 0):
+      if (frame["contentChecksum"]):
+        if (struct.unpack('<I', self.readBytes(4))[0] != self.contentHash.intdigest()):
+          raise ValueError("LZ4 content checksum mismatch")
+      self.frame = None
+      return False
+
+    uncompressed = (blockSize & LZ4Decoder.UncompressedFlag) != 0
+    blockSize &= ~LZ4Decoder.UncompressedFlag
+    if (blockSize > frame["maxBlockSize"]):
+      raise ValueError("LZ4 block is too large (" + str(blockSize) + " bytes)")
+    block = self.readBytes(blockSize)
+
+    # block checksum: xxHash32 of the block data as stored
+    if (frame["blockChecksum"]):
+      if (struct.unpack('<I', self.readBytes(4))[0] != xxhash32(block)):
+        raise ValueError("LZ4 block checksum mismatch")
+
+    if (uncompressed):
+      self.history += block
+    else:
+      self.decoder.decompressBlock(block, self.history)
+    if (self.contentHash is not None):
+      self.contentHash.update(memoryview(self.history)[self.position:])
+    return True
+
+  #-------------------------------------------------------------------------------------------------
+  # fill the caller's buffer with decoded data, returns the number of bytes (0 at the end of the stream)
+  #-------------------------------------------------------------------------------------------------
+  def readinto(self, buffer):
+    while (self.position == len(self.history)):
+      if (self.frame is None):
+        if (not self.nextFrame()):
+          return 0
+      else:
+        self.nextBlock()
+
+    buffer = memoryview(buffer).cast('B')
+    count = min(len(buffer), len(self.history) - self.position)
+    buffer[:count] = memoryview(self.history)[self.position:self.position + count]
+    self.position += count
+    return count
+
+
+#-------------------------------------------------------------------------------------------------
+# file object for reading or writing LZ4 frames, used like gzip.GzipFile
+# reading: read(), readinto(), readline(), iteration - decoded one block at a time
+# writing: write() returns immediately, blocks are compressed by a background thread
+#-------------------------------------------------------------------------------------------------
+class LZ4File(io.BufferedIOBase):
+
+  # number of blocks queued for the background compressor before write() waits
+  MaxPendingBlocks = 2
+
+  #-------------------------------------------------------------------------------------------------
+  # either filename or fileobj must be given, mode is 'rb', 'wb', 'xb' or 'ab' ('b' is optional)
+  # compressor is an LZ4 instance with the compression settings (default: new LZ4 instance)
+  # the same dictionary must be used for compression and decompression
+  #-------------------------------------------------------------------------------------------------
+  def __init__(self, filename = None, mode = 'rb', fileobj = None, compressor = None, dictionary = bytearray()):
+    mode = mode.replace('b', '')
+    assert mode in ('r', 'w', 'x', 'a'), "invalid mode " + mode
+    assert (filename is None) != (fileobj is None), "either filename or fileobj is needed"
+
+    self.ownsFile = fileobj is None
+    if (self.ownsFile):
+      fileobj = open(filename, mode + 'b')
+    self.fileobj = fileobj
+    self.mode = mode
+
+    if (mode == 'r'):
+      self.reader = io.BufferedReader(LZ4Reader(fileobj, dictionary))
+    else:
+      if (compressor is None):
+        compressor = LZ4()
+      self.stream = compressor.compressobj(dictionary)
+      self.blockSize = compressor.MaxBlockSize
+      self.pending = bytearray()
+      # single worker, so blocks are compressed and written in order
+      self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1)
+      self.jobs = collections.deque()
+      self.finished = False
+
+  def readable(self):
+    return self.mode == 'r'
+
+  def writable(self):
+    return self.mode != 'r'
+
+  def seekable(self):
+    return False
+
+  #-------------------------------------------------------------------------------------------------
+  # reading, see LZ4Reader
+  #-------------------------------------------------------------------------------------------------
+  def read(self, size = -1):
+    self.checkReadable()
+    return self.reader.read(size)
+
+  def read1(self, size = -1):
+    self.checkReadable()
+    return self.reader.read1(size)
+
+  def readinto(self, buffer):
+    self.checkReadable()
+    return self.reader.readinto(buffer)
+
+  def readinto1(self, buffer):
+    self.checkReadable()
+    return self.reader.readinto1(buffer)
+
+  def peek(self, size = 0):
+    self.checkReadable()
+    return self.reader.peek(size)
+
+  def readline(self, size = -1):
+    self.checkReadable()
+    return self.reader.readline(size)
+
+  def checkReadable(self):
+    if (self.closed):
+      raise ValueError("I/O operation on closed file")
+    if (self.mode != 'r'):
+      raise io.UnsupportedOperation("LZ4File is not open for reading")
+
+  #-------------------------------------------------------------------------------------------------
+  # writing, data is collected until a full block is available, which is compressed in the background
+  # returns the number of bytes written (always all of them)
+  #-------------------------------------------------------------------------------------------------
+  def write(self, data):
+    if (self.closed):
+      raise ValueError("I/O operation on closed file")
+    if (self.mode == 'r'):
+      raise io.UnsupportedOperation("LZ4File is not open for writing")
+
+    data = memoryview(data).cast('B')
+    self.pending += data
+    if (len(self.pending) >= self.blockSize):
+      self.submit(self.stream.feed, self.pending)
+      self.pending = bytearray()
+    return len(data)
+
+  # queue a compression step for the background thread, wait if too many blocks are queued already
+  def submit(self, function, *args):
+    self.jobs.append(self.executor.submit(self.compressJob, function, *args))
+    while (len(self.jobs) > self.MaxPendingBlocks):
+      self.jobs.popleft().result()
+
+  # background thread: compress and write the output
+  def compressJob(self, function, *args):
+    output = function(*args)
+    if (len(output) > 0):
+      self.fileobj.write(output)
+
+  # wait for the background thread, errors are raised here
+  def waitForJobs(self):
+    while (len(self.jobs) > 0):
+      self.jobs.popleft().result()
+
+  #-------------------------------------------------------------------------------------------------
+  # compress and write everything written so far (like zlib's Z_SYNC_FLUSH this costs some compression ratio)
+  #-------------------------------------------------------------------------------------------------
+  def flush(self):
+    if (self.closed or self.mode == 'r' or self.finished):
+      return
+    self.submit(self.stream.feed, self.pending)
+    self.pending = bytearray()
+    self.submit(self.stream.flush)
+    self.waitForJobs()
+    self.fileobj.flush()
+
+  #-------------------------------------------------------------------------------------------------
+  # end the frame (writing) and close the file if it was opened by LZ4File
+  #-------------------------------------------------------------------------------------------------
+  def close(self):
+    if (self.closed):
+      return
+    try:
+      if (self.mode != 'r'):
+        try:
+          self.submit(self.stream.feed, self.pending)
+          self.pending = bytearray()
+          self.submit(self.stream.finish)
+          self.waitForJobs()
+        finally:
+          self.finished = True
+          self.executor.shutdown()
+      else:
+        self.reader.close()
+    finally:
+      if (self.ownsFile):
+        self.fileobj.close()
+      super().close()
@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+# lz4split.py
+# Split-stream container: the optimal parse of lz4enc.py, stored as separate substreams (tokens, literals, lengths,
+# offsets) which are Huffman coded (huffman.py) or stored raw, whichever is smaller. Not LZ4 compatible.
+# By Simon Morris (https://github.com/simondotm/)
+# See https://github.com/simondotm/lz4enc-python
+#
+# Copyright (c) 2019 Simon Morris. All rights reserved.
+#
+# "MIT License":
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import struct
+import array
+import os
+import sys
+import argparse
+
+from lz4enc import LZ4
+from huffman import Huffman
+
+from timeit import default_timer as timer
+
+
+# Container format (all numbers little endian):
+#   [4 bytes] magic "LZ4S"
+#   [1 byte]  version
+#   [4 bytes] uncompressed size
+#   [1 byte]  number of substreams Ns
+#   Ns times: [1 byte] method, [4 bytes] decoded size, [4 bytes] stored size
+#   [data of each substream, in the same order]
+#
+# Substreams (see LZ4.resetStats, the separate streams of LZ4.StatsStreams):
+#   tokens      - one LZ4 token per sequence
+#   literals    - all literals
+#   lengths     - the extra length bytes (literal length first, then match length), where the token's length was 15
+#   offsetsLow  - low byte of each sequence's match distance
+#   offsetsHigh - high byte of each sequence's match distance
+# Every sequence has a distance, 0 means no match (the last sequence of each LZ4 block has literals only)
+#
+# Methods:
+#   raw     - the substream as is
+#   huffman - the substream encoded by huffman.py (with its header)
+#   fill    - a single byte, repeated decoded size times
+class LZ4Split():
+
+  Magic   = b"LZ4S"
+  Version = 1
+
+  MethodRaw     = 0
+  MethodHuffman = 1
+  MethodFill    = 2
+
+  Streams = [ "tokens", "literals", "lengths", "offsetsLow", "offsetsHigh" ]
+
+  # huffman.py stores the decoded size in 29 bits
+  MaxHuffmanSize = (1 << 29) - 1
+
+  Verbose = False
+
+  #-------------------------------------------------------------------------------------------------
+  # compressor is an LZ4 instance with the compression settings (default: new LZ4 instance)
+  # its optimal parser is used, the LZ4 output itself is discarded
+  #-------------------------------------------------------------------------------------------------
+  def __init__(self, compressor = None):
+    if (compressor is None):
+      compressor = LZ4()
+    self.compressor = compressor
+
+  #-------------------------------------------------------------------------------------------------
+  # compress inputData (any buffer) into a split-stream container, returns a bytearray
+  # use the same dictionary for decompression
+  #-------------------------------------------------------------------------------------------------
+  def compress(self, inputData, dictionary = bytearray()):
+    inputData = memoryview(inputData).cast('B')
+    streams = self.parse(inputData, dictionary)
+
+    header = bytearray(self.Magic)
+    header.append(self.Version)
+    header.extend(struct.pack('<I', len(inputData)))
+    header.append(len(streams))
+
+    body = bytearray()
+    for name, stream in zip(self.Streams, streams):
+      method, stored = self.encodeStream(stream)
+      header.extend(struct.pack('<BII', method, len(stream), len(stored)))
+      body.extend(stored)
+
+      if self.Verbose:
+        print(" " + name + ": " + str(len(stream)) + " bytes, stored " + ["raw", "huffman", "fill"][method] + " in " + str(len(stored)) + " bytes")
+
+    return header + body
+
+  # run the optimal parser and return the substreams
+  def parse(self, inputData, dictionary):
+    compressor = self.compressor
+    statsLevel = compressor.statsLevel
+    compressor.setStats(LZ4.StatsStreams)
+    try:
+      compressor.compress(inputData, dictionary)
+      stats = compressor.stats
+    finally:
+      compressor.setStats(statsLevel)
+
+    tokens = stats["tokens"]
+    literals = stats["literal_bytes"]
+    lengths = stats["lengths_bytes"]
+    offsets = array.array('H', stats["offsets"])
+
+    # no parsing at all (compression level 0): a single sequence of literals
+    if (len(tokens) == 0 and len(inputData) > 0):
+      numLiterals = len(inputData)
+      tokens = bytearray([min(numLiterals, 15) << 4])
+      literals = bytearray(inputData)
+      lengths = bytearray()
+      if (numLiterals >= 15):
+        numLiterals -= 15
+        lengths.extend(b"\xFF" * (numLiterals // 255))
+        lengths.append(numLiterals % 255)
+      offsets = array.array('H', [0])
+
+    if (sys.byteorder == 'big'):
+      offsets.byteswap()
+    offsets = offsets.tobytes()
+    return [ tokens, literals, lengths, offsets[0::2], offsets[1::2] ]
+
+  # encode a substream with the method that needs the fewest bytes, returns (method, stored bytes)
+  def encodeStream(self, stream):
+    stream = bytes(stream)
+    if (len(stream) > 0 and stream.count(stream[0]) == len(stream)):
+      return self.MethodFill, stream[:1]
+
+    # at least two different symbols, otherwise it's a fill
+    if (len(stream) > 0 and len(stream) <= self.MaxHuffmanSize):
+      huffman = Huffman()
+      huffman.build(stream)
+      # 256 codes of 8 bits don't fit into the Huffman header, but raw data is just as small then
+      if (max(huffman.table_bitlengths[1:]) < 256):
+        encoded = huffman.encode(stream, header = True)
+        if (len(encoded) < len(stream)):
+          return self.MethodHuffman, bytes(encoded)
+
+    return self.MethodRaw, stream
+
+
+#-------------------------------------------------------------------------------------------------
+# decoder of the split-stream container
+# the substreams are decoded first, then each sequence's literals are copied as one slice
+# and overlapping matches repeat their pattern (like lz4dec.py)
+#-------------------------------------------------------------------------------------------------
+class LZ4SplitDecoder():
+
+  # each match's length must be >= 4
+  MinMatch      = 4
+  # only the most recent 64k of a dictionary can be referenced
+  MaxDictionary = 65536
+
+  #-------------------------------------------------------------------------------------------------
+  # decompress a split-stream container, use the same dictionary as the compressor
+  # returns a bytearray with the decompressed data, raises a ValueError if the data is corrupt
+  #-------------------------------------------------------------------------------------------------
+  def decompress(self, data, dictionary = bytearray()):
+    data = memoryview(data).cast('B')
+    tokens, literals, lengths, offsetsLow, offsetsHigh, size = self.readStreams(data)
+
+    # matches may refer to the dictionary
+    output = bytearray(memoryview(dictionary)[-self.MaxDictionary:]) if len(dictionary) > 0 else bytearray()
+    prefix = len(output)
+    MinMatch = self.MinMatch
+
+    literalPos = 0
+    lengthPos = 0
+    try:
+      for index, token in enumerate(tokens):
+
+        # ----- literals -----
+        numLiterals = token >> 4
+        if (numLiterals == 15):
+          while (True):
+            extra = lengths[lengthPos]
+            lengthPos += 1
+            numLiterals += extra
+            if (extra != 255):
+              break
+
+        if (numLiterals > 0):
+          if (literalPos + numLiterals > len(literals)):
+            raise ValueError("LZ4S literals are truncated")
+          output += literals[literalPos:literalPos + numLiterals]
+          literalPos += numLiterals
+
+        # ----- match -----
+        distance = offsetsLow[index] | (offsetsHigh[index] << 8)
+        if (distance == 0):
+          continue
+
+        matchLength = (token & 15) + MinMatch
+        if (matchLength == 15 + MinMatch):
+          while (True):
+            extra = lengths[lengthPos]
+            lengthPos += 1
+            matchLength += extra
+            if (extra != 255):
+              break
+
+        start = len(output) - distance
+        if (start < 0):
+          raise ValueError("invalid LZ4S match distance " + str(distance))
+
+        if (matchLength <= distance):
+          output += output[start:start + matchLength]
+        else:
+          # overlapping match: the last 'distance' bytes are repeated
+          pattern = output[start:]
+          output += (pattern * (matchLength // distance + 1))[:matchLength]
+
+    except IndexError:
+      raise ValueError("LZ4S substreams are truncated")
+
+    del output[:prefix]
+    if (len(output) != size):
+      raise ValueError("LZ4S size mismatch, expected " + str(size) + " bytes, decoded " + str(len(output)))
+    return output
+
+  # read the header and decode all substreams, returns the substreams and the uncompressed size
+  def readStreams(self, data):
+    if (len(data) < 10 or bytes(data[:4]) != LZ4Split.Magic):
+      raise ValueError("not an LZ4S container")
+    if (data[4] != LZ4Split.Version):
+      raise ValueError("unsupported LZ4S version " + str(data[4]))
+    size = struct.unpack_from('<I', data, 5)[0]
+    count = data[9]
+    if (count != len(LZ4Split.Streams)):
+      raise ValueError("unexpected number of LZ4S substreams (" + str(count) + ")")
+
+    offset = 10 + count * 9
+    if (offset > len(data)):
+      raise ValueError("LZ4S header is truncated")
+
+    streams = []
+    for n in range(count):
+      method, decodedSize, storedSize = struct.unpack_from('<BII', data, 10 + n * 9)
+      if (offset + storedSize > len(data)):
+        raise ValueError("LZ4S substream " + LZ4Split.Streams[n] + " is truncated")
+      stored = data[offset:offset + storedSize]
+      offset += storedSize
+      streams.append(self.decodeStream(method, stored, decodedSize))
+
+    if (len(streams[3]) != len(streams[0]) or len(streams[4]) != len(streams[0])):
+      raise ValueError("LZ4S offsets don't match the number of tokens")
+    return streams + [size]
+
+  # decode a substream, returns bytes
+  def decodeStream(self, method, stored, decodedSize):
+    if (method == LZ4Split.MethodRaw):
+      stream = bytes(stored)
+    elif (method == LZ4Split.MethodFill):
+      stream = bytes(stored) * decodedSize
+    elif (method == LZ4Split.MethodHuffman):
+      stream = bytes(Huffman().decode(bytes(stored)))
+    else:
+      raise ValueError("unknown LZ4S substream method " + str(method))
+
+    if (len(stream) != decodedSize):
+      raise ValueError("LZ4S substream size mismatch")
+    return stream
+
+
+#-------------------------
+# main()
+#-------------------------
+
+def main(args):
+
+  start_time = timer()
+
+  LZ4Split.Verbose = args.verbose
+
+  src = args.input
+  dst = args.output
+  if dst == None:
+    if args.decompress:
+      dst = src[:-5] if src.endswith(".lz4s") else src + ".out"
+    else:
+      dst = src + ".lz4s"
+
+  # check for missing files
+  if not os.path.isfile(src):
+    print("ERROR: File '" + src + "' not found")
+    sys.exit()
+
+  if os.path.isfile(dst) and not args.force:
+    print("ERROR: File '" + dst + "' already exists, use -f to overwrite it")
+    sys.exit()
+
+  dictionary = bytearray()
+  if args.dict:
+    dictionary = bytearray(open(args.dict, 'rb').read())
+
+  fh = open(src, 'rb')
+  file_in = fh.read()
+  fh.close()
+
+  if args.decompress:
+    file_out = LZ4SplitDecoder().decompress(file_in, dictionary)
+    print("Decompressed " + str(len(file_in)) + " bytes into " + str(len(file_out)) + " bytes")
+
+  else:
+    compressor = LZ4()
+    compressor.setCompression(args.compress, args.window, args.matchfinder)
+    if args.optimized:
+      compressor.optimizedCompression(True)
+
+    file_out = LZ4Split(compressor).compress(file_in, dictionary)
+
+    # decode the output again before it's written
+    if args.verify:
+      if LZ4SplitDecoder().decompress(file_out, dictionary) != file_in:
+        raise ValueError("LZ4S verification failed, decoded data differs from the input")
+
+    ratio = 0 if len(file_in) == 0 else 100 - (int)((len(file_out)*100 / len(file_in)))
+    print("Compressed " + str(len(file_in)) + " bytes into " + str(len(file_out)) + " bytes => " + str(ratio) + "%" )
+
+  fh = open(dst, 'wb')
+  fh.write(file_out)
+  fh.close()
+
+  end_time = timer()
+
+  if LZ4Split.Verbose:
+    t = '{:.2f}'.format(end_time-start_time)
+    print("Completed in " + t + "s.")
+
+#--------------------------------
+
+# Determine if running as a script
+if __name__ == '__main__':
+
+  print("lz4split.py : LZ4 optimal parsing with Huffman coded substreams (not LZ4 compatible)")
+  print("Written in 2019 by Simon M, https://github.com/simondotm/")
+  print("")
+
+  parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter)
+
+  parser.add_argument("input", help="read from file [input]")
+  parser.add_argument("-o", "--output", help="write to file [output] (default is '[input].lz4s', or without '.lz4s' when decompressing)")
+  parser.add_argument("-d", "--decompress", help="Decompress instead of compress", action="store_true")
+  parser.add_argument("-D", "--dict", metavar="file", help="Load dictionary file")
+  parser.add_argument("-c", "--compress", type=int, default=9, metavar="int", help="Set compression level (0-9), default: 9")
+  parser.add_argument("-f", "--force", help="Overwrite an existing file", action="store_true")
+  parser.add_argument("-w", "--window", type=int, default=LZ4.MaxDistance, help="Set LZ4 window size, default:"+str(LZ4.MaxDistance))
+  parser.add_argument("-m", "--matchfinder", default=LZ4.MatchFinderHashChain, choices=LZ4.MatchFinders, help="Set match finder engine, default:"+LZ4.MatchFinderHashChain)
+  parser.add_argument("-O", "--optimized", help="Limit match offsets to 8 bits, window size 255 (the high offset bytes vanish)", action="store_true")
+  parser.add_argument("--verify", help="Decompress the output and compare it with the input before writing it", action="store_true")
+  parser.add_argument("-v", "--verbose", help="Enable verbose mode", action="store_true")
+  args = parser.parse_args()
+
+  main(args)
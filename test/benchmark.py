@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+# benchmark.py
+# Benchmark of lz4enc.py and smallz4.py on synthetic corpora, compared with the smallz4 C++ reference (src/smallz4.cpp)
+# By Simon Morris (https://github.com/simondotm/)
+# See https://github.com/simondotm/lz4enc-python
+#
+# Copyright (c) 2019 Simon Morris. All rights reserved.
+#
+# "MIT License":
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import os
+import sys
+import io
+import json
+import random
+import struct
+import argparse
+import datetime
+import platform
+import subprocess
+import tempfile
+import contextlib
+import tracemalloc
+from timeit import default_timer as timer
+
+# the encoders live in the parent folder
+TestFolder = os.path.dirname(os.path.abspath(__file__))
+RootFolder = os.path.dirname(TestFolder)
+sys.path.insert(0, RootFolder)
+
+import lz4enc
+from lz4enc import LZ4
+from smallz4 import SmallLZ4
+
+
+#-------------------------------------------------------------------------------------------------
+# synthetic corpora, each generator returns size bytes, the same for the same size (seeded)
+#-------------------------------------------------------------------------------------------------
+
+# incompressible data
+def corpusRandom(size, rng):
+  return bytes(rng.getrandbits(8) for _ in range(size))
+
+# English-like text: words of a small vocabulary with a skewed distribution, punctuation and line breaks
+def corpusText(size, rng):
+  words = ("the of and to in is was that for it with as his on be at by had are but from or have an they which one you were "
+    "all her she there would their we him been has when who will more no if out so said what up its about into than them "
+    "can only other new some could time these two may then do first any my now such like our over man me even most made "
+    "after also did many before must through back years where much your way well down should because each just those "
+    "compression decoder literal match offset token block frame window").split()
+  weights = [1.0 / (rank + 1) for rank in range(len(words))]
+  output = bytearray()
+  while (len(output) < size):
+    sentence = rng.choices(words, weights, k = rng.randint(4, 16))
+    sentence[0] = sentence[0].capitalize()
+    output += (" ".join(sentence) + rng.choice([". ", ". ", ", ", "? ", ".\n"])).encode('ascii')
+  return bytes(output[:size])
+
+# long runs of the same byte, with short random sequences in between
+def corpusRuns(size, rng):
+  output = bytearray()
+  while (len(output) < size):
+    output += bytes([rng.getrandbits(8)]) * rng.randint(16, 1024)
+    output += bytes(rng.getrandbits(8) for _ in range(rng.randint(0, 8)))
+  return bytes(output[:size])
+
+# table of fixed size records (id, type, flags, coordinates, timestamp, name) like a binary file format
+def corpusBinary(size, rng):
+  names = [ b"player", b"enemy", b"door", b"key", b"coin", b"wall", b"trigger", b"light" ]
+  output = bytearray()
+  id = 0
+  timestamp = 1500000000
+  while (len(output) < size):
+    id += 1
+    timestamp += rng.randint(0, 30)
+    kind = rng.randint(0, len(names) - 1)
+    output += struct.pack('<IBBhhiI8s', id, kind, rng.choice([0, 0, 1, 3]), rng.randint(-512, 512), rng.randint(-64, 64), rng.randint(0, 100) * 1000, timestamp, names[kind])
+  return bytes(output[:size])
+
+# 6502-like machine code: opcodes with 0-2 operand bytes, addresses clustered on a few pages,
+# subroutines (JSR) and code sequences which are repeated with small changes
+def corpusCode6502(size, rng):
+  # opcodes by number of operand bytes
+  implied   = [ 0x0A, 0x18, 0x38, 0x48, 0x68, 0x88, 0x8A, 0x98, 0xA8, 0xAA, 0xC8, 0xCA, 0xE8, 0x60, 0xEA ]
+  immediate = [ 0x09, 0x29, 0x49, 0x69, 0xA0, 0xA2, 0xA9, 0xC9, 0xE0, 0xE9, 0x85, 0xA5, 0xC6, 0xE6, 0x10, 0x30, 0x90, 0xB0, 0xD0, 0xF0 ]
+  absolute  = [ 0x0D, 0x2D, 0x4C, 0x6D, 0x8D, 0x8E, 0x8C, 0xAD, 0xAE, 0xAC, 0xBD, 0xB9, 0x9D, 0x99, 0xCD, 0xEE, 0x20 ]
+  pages = [ 0x00, 0x02, 0x04, 0x20, 0x21, 0x30, 0xFE, 0xFF ]
+
+  def instruction():
+    kind = rng.random()
+    if (kind < 0.25):
+      return bytes([rng.choice(implied)])
+    if (kind < 0.65):
+      return bytes([rng.choice(immediate), rng.choice([0x00, 0x01, 0xFF, 0x80, 0x20, rng.getrandbits(8)])])
+    return bytes([rng.choice(absolute), rng.getrandbits(8) & 0xF0, rng.choice(pages)])
+
+  output = bytearray()
+  sequences = []
+  while (len(output) < size):
+    if (len(sequences) > 0 and rng.random() < 0.3):
+      # copy an earlier sequence, sometimes with a different operand
+      sequence = bytearray(rng.choice(sequences))
+      if (rng.random() < 0.5):
+        sequence[rng.randint(0, len(sequence) - 1)] = rng.getrandbits(8)
+    else:
+      sequence = bytearray()
+      for _ in range(rng.randint(3, 24)):
+        sequence += instruction()
+      sequences.append(bytes(sequence))
+    output += sequence
+  return bytes(output[:size])
+
+Corpora = {
+  "random"  : corpusRandom,
+  "text"    : corpusText,
+  "runs"    : corpusRuns,
+  "binary"  : corpusBinary,
+  "code6502": corpusCode6502,
+}
+
+def makeCorpus(name, size):
+  return Corpora[name](size, random.Random(name + str(size)))
+
+
+#-------------------------------------------------------------------------------------------------
+# encoders, each one compresses data with a compression level and returns the compressed bytes
+#-------------------------------------------------------------------------------------------------
+
+def encodeLZ4(data, level):
+  compressor = LZ4(level)
+  return bytes(compressor.compress(data))
+
+def encodeLZ4Optimized(data, level):
+  compressor = LZ4(level)
+  compressor.optimizedCompression(True)
+  return bytes(compressor.compress(data))
+
+# SmallLZ4 works on file objects and prints its progress
+def encodeSmallLZ4(data, level):
+  output = io.BytesIO()
+  with contextlib.redirect_stdout(io.StringIO()):
+    SmallLZ4(level).compress(io.BytesIO(data), output, bytearray(), False)
+  return output.getvalue()
+
+# name: function, LZ4 compatible (compared with the reference)
+Encoders = {
+  "lz4enc"          : (encodeLZ4, True),
+  "lz4enc-optimized": (encodeLZ4Optimized, False),
+  "smallz4"         : (encodeSmallLZ4, True),
+}
+
+
+#-------------------------------------------------------------------------------------------------
+# the smallz4 C++ reference, compiled from src/smallz4.cpp into folder (only if the source is newer)
+# returns the path of the executable or None if it can't be built
+#-------------------------------------------------------------------------------------------------
+def buildReference(folder, compiler):
+  source = os.path.join(RootFolder, "src", "smallz4.cpp")
+  executable = os.path.join(folder, "smallz4")
+  if (os.path.isfile(executable) and os.path.getmtime(executable) >= os.path.getmtime(source)):
+    return executable
+
+  os.makedirs(folder, exist_ok = True)
+  print("Building reference '" + executable + "' with " + compiler + "...")
+  try:
+    subprocess.run([compiler, "-O2", "-o", executable, source], check = True)
+  except (OSError, subprocess.CalledProcessError) as error:
+    print("WARNING: can't build the smallz4 reference (" + str(error) + "), output isn't compared")
+    return None
+  return executable
+
+# compress data with the reference, returns the compressed bytes and the time (including the process start)
+def runReference(executable, data, level):
+  with tempfile.TemporaryDirectory() as folder:
+    src = os.path.join(folder, "input")
+    dst = os.path.join(folder, "input.lz4")
+    with open(src, 'wb') as fh:
+      fh.write(data)
+    # note: the level has to be a flag of its own, smallz4 misreads combined flags such as -f9
+    start = timer()
+    subprocess.run([executable, "-f", "-" + str(level), src, dst], check = True)
+    seconds = timer() - start
+    with open(dst, 'rb') as fh:
+      return fh.read(), seconds
+
+
+#-------------------------------------------------------------------------------------------------
+# measure one encoder: best time of several runs and (optionally) the peak memory of another run
+#-------------------------------------------------------------------------------------------------
+def measure(function, data, level, repeat, traceMemory):
+  seconds = None
+  for _ in range(repeat):
+    start = timer()
+    output = function(data, level)
+    elapsed = timer() - start
+    if (seconds is None or elapsed < seconds):
+      seconds = elapsed
+
+  # tracemalloc slows everything down, so memory is measured separately
+  peakMemory = None
+  if (traceMemory):
+    tracemalloc.start()
+    function(data, level)
+    peakMemory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+  return output, seconds, peakMemory
+
+def result(corpus, size, encoder, level, output, seconds, peakMemory, matchesReference):
+  return {
+    "corpus"          : corpus,
+    "size"            : size,
+    "encoder"         : encoder,
+    "level"           : level,
+    "bytesOut"        : len(output),
+    "ratio"           : size / len(output),
+    "seconds"         : seconds,
+    "mbPerSecond"     : size / seconds / 1000000 if seconds > 0 else None,
+    "peakMemory"      : peakMemory,
+    "matchesReference": matchesReference,
+  }
+
+def showResult(result):
+  memory = "-" if result["peakMemory"] is None else str(result["peakMemory"] >> 10) + "Kb"
+  speed = "-" if result["mbPerSecond"] is None else '{:.3f}'.format(result["mbPerSecond"])
+  reference = { None: "", True: "same", False: "DIFFERENT" }[result["matchesReference"]]
+  print('{:<9}{:>9} {:<17}{:>2}{:>10}{:>8.3f}{:>10}{:>10}  {}'.format(result["corpus"], result["size"], result["encoder"], result["level"],
+    result["bytesOut"], result["ratio"], speed, memory, reference))
+
+
+#-------------------------------------------------------------------------------------------------
+# compare the results with the previous run of the history: any change of the compressed size,
+# or a speed drop of more than tolerance (fraction), returns the number of regressions
+#-------------------------------------------------------------------------------------------------
+def compareRuns(previous, current, tolerance):
+  def key(result):
+    return (result["corpus"], result["size"], result["encoder"], result["level"])
+  before = { key(result) : result for result in previous["results"] }
+
+  regressions = 0
+  for result in current["results"]:
+    old = before.get(key(result))
+    if (old is None):
+      continue
+    name = " ".join(str(x) for x in key(result))
+    if (result["bytesOut"] != old["bytesOut"]):
+      print("  " + name + ": output size " + str(old["bytesOut"]) + " => " + str(result["bytesOut"]))
+      if (result["bytesOut"] > old["bytesOut"]):
+        regressions += 1
+    if (old["mbPerSecond"] and result["mbPerSecond"] and result["mbPerSecond"] < old["mbPerSecond"] * (1 - tolerance)):
+      print("  " + name + ": speed " + '{:.3f} => {:.3f}'.format(old["mbPerSecond"], result["mbPerSecond"]) + " MB/s")
+      regressions += 1
+    if (old["matchesReference"] and result["matchesReference"] == False):
+      print("  " + name + ": output doesn't match the reference anymore")
+      regressions += 1
+  return regressions
+
+# the current git commit, if any
+def gitCommit():
+  try:
+    return subprocess.run(["git", "rev-parse", "HEAD"], cwd = RootFolder, capture_output = True, text = True, check = True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+# parse a list of numbers: "1,4,16k" or ranges "0-9"
+def parseList(text):
+  values = []
+  for part in text.split(","):
+    if ("-" in part):
+      first, last = part.split("-")
+      values.extend(range(int(first), int(last) + 1))
+    elif (part.lower().endswith("k")):
+      values.append(int(part[:-1]) * 1024)
+    else:
+      values.append(int(part))
+  return values
+
+
+#-------------------------
+# main()
+#-------------------------
+
+def main(args):
+  sizes = parseList(args.sizes)
+  levels = parseList(args.levels)
+  corpora = args.corpora.split(",")
+  encoders = args.encoders.split(",")
+  for name in corpora:
+    assert name in Corpora, "unknown corpus " + name
+  for name in encoders:
+    assert name in Encoders, "unknown encoder " + name
+
+  reference = None
+  if (not args.no_reference):
+    reference = buildReference(args.build, args.compiler)
+
+  run = {
+    "date"   : datetime.datetime.now().isoformat(timespec = 'seconds'),
+    "commit" : gitCommit(),
+    "python" : platform.python_version(),
+    "numpy"  : LZ4.UseNumpy and lz4enc.numpy is not None,
+    "results": [],
+  }
+
+  print('{:<9}{:>9} {:<17}{:>2}{:>10}{:>8}{:>10}{:>10}  {}'.format("corpus", "size", "encoder", "L", "bytesOut", "ratio", "MB/s", "memory", "reference"))
+  for corpus in corpora:
+    for size in sizes:
+      data = makeCorpus(corpus, size)
+      for level in levels:
+        expected = None
+        if (reference is not None):
+          expected, seconds = runReference(reference, data, level)
+          run["results"].append( result(corpus, size, "smallz4-cpp", level, expected, seconds, None, None) )
+          showResult(run["results"][-1])
+
+        for encoder in encoders:
+          function, compatible = Encoders[encoder]
+          output, seconds, peakMemory = measure(function, data, level, args.repeat, not args.no_memory)
+          matchesReference = None
+          if (expected is not None and compatible):
+            matchesReference = (output == expected)
+          run["results"].append( result(corpus, size, encoder, level, output, seconds, peakMemory, matchesReference) )
+          showResult(run["results"][-1])
+
+  # compare with the previous run and add this run to the history
+  history = []
+  if (os.path.isfile(args.history)):
+    with open(args.history, 'r') as fh:
+      history = json.load(fh)
+
+  regressions = 0
+  if (len(history) > 0):
+    print("Changes since the previous run (" + history[-1]["date"] + "):")
+    regressions = compareRuns(history[-1], run, args.tolerance)
+    print(str(regressions) + " regression(s)")
+
+  if (not args.dry_run):
+    history.append(run)
+    with open(args.history, 'w') as fh:
+      json.dump(history, fh, indent = 1)
+
+  mismatches = sum(1 for x in run["results"] if x["matchesReference"] == False)
+  if (mismatches > 0):
+    print(str(mismatches) + " result(s) don't match the reference")
+
+  return 1 if (regressions > 0 or mismatches > 0) else 0
+
+#--------------------------------
+
+# Determine if running as a script
+if __name__ == '__main__':
+
+  parser = argparse.ArgumentParser(description = "Benchmark of lz4enc.py and smallz4.py, results are added to a JSON history")
+  parser.add_argument("-s", "--sizes", default="4k,64k", help="Corpus sizes in bytes (k = 1024), default: 4k,64k")
+  parser.add_argument("-c", "--levels", default="0-9", help="Compression levels, default: 0-9")
+  parser.add_argument("-k", "--corpora", default=",".join(Corpora), help="Corpora, default: " + ",".join(Corpora))
+  parser.add_argument("-e", "--encoders", default=",".join(Encoders), help="Encoders, default: " + ",".join(Encoders))
+  parser.add_argument("-r", "--repeat", type=int, default=1, metavar="int", help="Time the best of this many runs, default: 1")
+  parser.add_argument("--no-memory", help="Don't measure the peak memory (saves one run per result)", action="store_true")
+  parser.add_argument("--no-reference", help="Don't compare the output with the smallz4 C++ reference", action="store_true")
+  parser.add_argument("--compiler", default=os.environ.get("CXX", "c++"), help="C++ compiler for the reference, default: $CXX or c++")
+  parser.add_argument("--build", default=os.path.join(TestFolder, "build"), help="Folder of the reference executable, default: test/build")
+  parser.add_argument("--history", default=os.path.join(TestFolder, "benchmark_history.json"), help="JSON history file, default: test/benchmark_history.json")
+  parser.add_argument("--tolerance", type=float, default=0.1, help="Speed drop reported as a regression, default: 0.1 (10%%)")
+  parser.add_argument("-n", "--dry-run", help="Don't add the results to the history", action="store_true")
+  args = parser.parse_args()
+
+  sys.exit(main(args))
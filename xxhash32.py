@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# xxhash32.py
+# Python implementation of Yann Collet's xxHash32, used for the checksums of LZ4 frames
+# By Simon Morris (https://github.com/simondotm/)
+# See https://github.com/simondotm/lz4enc-python
+#
+# Based on the xxHash specification, see https://github.com/Cyan4973/xxHash/blob/dev/doc/xxhash_spec.md
+#
+# Copyright (c) 2019 Simon Morris. All rights reserved.
+#
+# "MIT License":
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the Software
+# is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+# HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import struct
+import array
+import sys
+
+
+# xxHash32 primes
+Prime1 = 2654435761
+Prime2 = 2246822519
+Prime3 = 3266489917
+Prime4 =  668265263
+Prime5 =  374761393
+
+Mask32 = 0xFFFFFFFF
+
+
+# rotate a 32 bit value to the left
+def rotateLeft(value, bits):
+  return ((value << bits) | (value >> (32 - bits))) & Mask32
+
+# process the 32 bit words of one lane (every 4th word of the stripes), returns the new accumulator
+# (the high bits of value << 13 vanish in the multiplication, no need to mask them first)
+def processLane(accumulator, words):
+  for word in words:
+    accumulator = (accumulator + word * Prime2) & Mask32
+    accumulator = (((accumulator << 13) | (accumulator >> 19)) * Prime1) & Mask32
+  return accumulator
+
+
+#-------------------------------------------------------------------------------------------------
+# incremental xxHash32 (similar to hashlib objects): update() can be called with chunks of any size
+# data is processed in 16 byte stripes, each of the four lanes in one pass over an array of 32 bit words
+#-------------------------------------------------------------------------------------------------
+class XXHash32():
+
+  def __init__(self, data = None, seed = 0):
+    self.seed = seed
+    # four accumulators, one per 4 byte lane of each 16 byte stripe
+    self.lanes = [ (seed + Prime1 + Prime2) & Mask32, (seed + Prime2) & Mask32, seed, (seed - Prime1) & Mask32 ]
+    # total number of bytes so far
+    self.length = 0
+    # less than 16 bytes, waiting for the rest of their stripe
+    self.pending = bytearray()
+    if (data is not None):
+      self.update(data)
+
+  #-------------------------------------------------------------------------------------------------
+  # hash more data (bytes, bytearray, memoryview)
+  #-------------------------------------------------------------------------------------------------
+  def update(self, data):
+    data = memoryview(data).cast('B')
+    self.length += len(data)
+
+    # complete a pending stripe first
+    if (len(self.pending) > 0):
+      missing = 16 - len(self.pending)
+      self.pending += data[:missing]
+      data = data[missing:]
+      if (len(self.pending) < 16):
+        return
+      self.processStripes(self.pending)
+      self.pending = bytearray()
+
+    stripes = len(data) & ~15
+    if (stripes > 0):
+      self.processStripes(data[:stripes])
+    self.pending += data[stripes:]
+
+  # process complete 16 byte stripes
+  def processStripes(self, data):
+    words = array.array('I')
+    words.frombytes(data)
+    if (sys.byteorder == 'big'):
+      words.byteswap()
+
+    lanes = self.lanes
+    for lane in range(4):
+      lanes[lane] = processLane(lanes[lane], words[lane::4])
+
+  #-------------------------------------------------------------------------------------------------
+  # the hash of all data so far as a 32 bit integer (more data can still be added afterwards)
+  #-------------------------------------------------------------------------------------------------
+  def intdigest(self):
+    if (self.length >= 16):
+      v1, v2, v3, v4 = self.lanes
+      result = (rotateLeft(v1, 1) + rotateLeft(v2, 7) + rotateLeft(v3, 12) + rotateLeft(v4, 18)) & Mask32
+    else:
+      result = (self.seed + Prime5) & Mask32
+
+    result = (result + self.length) & Mask32
+
+    # remaining 4 byte words and single bytes
+    data = self.pending
+    pos = 0
+    while (pos + 4 <= len(data)):
+      result = (rotateLeft((result + struct.unpack_from('<I', data, pos)[0] * Prime3) & Mask32, 17) * Prime4) & Mask32
+      pos += 4
+    while (pos < len(data)):
+      result = (rotateLeft((result + data[pos] * Prime5) & Mask32, 11) * Prime1) & Mask32
+      pos += 1
+
+    # final mix
+    result ^= result >> 15
+    result = (result * Prime2) & Mask32
+    result ^= result >> 13
+    result = (result * Prime3) & Mask32
+    result ^= result >> 16
+    return result
+
+  # the hash as 4 bytes, little endian (as stored in LZ4 frames)
+  def digest(self):
+    return struct.pack('<I', self.intdigest())
+
+#-------------------------------------------------------------------------------------------------
+# xxHash32 of a buffer (bytes, bytearray, memoryview), returns a 32 bit integer
+#-------------------------------------------------------------------------------------------------
+def xxhash32(data, seed = 0):
+  return XXHash32(data, seed).intdigest()